@@ -1,47 +1,356 @@
-from flask import Flask, render_template, request, jsonify, send_file, url_for
+import time
+
+# Начало старта приложения (для замера времени запуска)
+_startup_begin = time.perf_counter()
+
+from flask import Flask, render_template, request, jsonify, send_file, url_for, Response, stream_with_context
 from flask_cors import CORS
 import os
-import time
+import json
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
 
+import config
+from batching import BatchScheduler
+from bulk import (ArchiveLimitError, BulkSummary, detect_stream, is_archive, iter_archive,
+                  read_limited, spool)
+from detector_pool import DetectorPool
 from fruit_detector import FruitDetector
+from job_queue import JobQueue, QueueFullError, wait_stored_job
+from result_cache import ResultCache
 from database import DatabaseManager
-from report_generator import ReportGenerator
-from utils import save_uploaded_file, cleanup_old_files, format_statistics
+from report_generator import ReportGenerator, HISTORY_FORMATS, history_format_available
+from report_service import ReportService, REPORT_FORMATS
+from metrics import timed, tracer
+from renderer import IMAGE_MIMETYPES, ResultRenderer
+from response_cache import ResponseCache
+from retention import RetentionManager
+from stream_manager import StreamManager
+from video_pipeline import MotionSampler
+from utils import (allowed_file, allowed_stream_source, make_upload_filename, save_upload_data,
+                   format_statistics)
+
+# Длительность этапов запуска, секунды (GET /startup/stats)
+STARTUP_TIMINGS = {'imports': round(time.perf_counter() - _startup_begin, 4)}
+
+# Замер этапов обработки (при выключении stage() почти ничего не стоит)
+tracer.enabled = config.TRACING_ENABLED
 
 # Инициализация Flask приложения
 app = Flask(__name__)
 CORS(app)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max file size
+# Общий лимит - для пакетной загрузки; одиночная загрузка ограничена в /upload
+app.config['MAX_CONTENT_LENGTH'] = config.BULK_MAX_CONTENT_LENGTH
+UPLOAD_MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB max file size
 
 # Создаем необходимые директории
 UPLOAD_FOLDER = 'static/uploads'
 RESULT_FOLDER = 'static/results'
+RENDER_FOLDER = 'static/results/rendered'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULT_FOLDER, exist_ok=True)
+os.makedirs(RENDER_FOLDER, exist_ok=True)
 
 # Инициализация компонентов
-detector = FruitDetector()
-db_manager = DatabaseManager()
+detector_options = {
+    'backend': config.INFERENCE_BACKEND,
+    'tile_mode': config.TILE_MODE,
+    'tile_size': config.TILE_SIZE,
+    'tile_overlap': config.TILE_OVERLAP,
+    'tile_min_side': config.TILE_MIN_SIDE,
+    'tile_batch_size': config.TILE_BATCH_SIZE,
+    'calibration_data': config.INT8_CALIBRATION_DATA
+}
+with timed(STARTUP_TIMINGS, 'database'):
+    # Для ленивой отрисовки результатов нужны сохраненные детекции
+    db_manager = DatabaseManager(store_detections=config.STORE_DETECTIONS or config.LAZY_RESULTS,
+                                 batch_writes=config.DB_BATCH_WRITES,
+                                 batch_interval_ms=config.DB_BATCH_INTERVAL_MS)
 report_gen = ReportGenerator(RESULT_FOLDER)
+report_service = ReportService(report_gen, workers=config.REPORT_WORKERS)
+
+# Кэш результатов для повторно загружаемых изображений
+result_cache = None
+if config.RESULT_CACHE_ENABLED:
+    result_cache = ResultCache(max_entries=config.RESULT_CACHE_MAX_ENTRIES,
+                               ttl=config.RESULT_CACHE_TTL,
+                               db_path=config.RESULT_CACHE_DB or None)
+
+# Ответы панели (/, /history, /statistics) кэшируются до следующего сохраненного запроса
+response_cache = ResponseCache(lambda: db_manager.get_data_version(),
+                               max_entries=config.RESPONSE_CACHE_MAX_ENTRIES,
+                               gzip_min_bytes=config.RESPONSE_GZIP_MIN_BYTES,
+                               enabled=config.RESPONSE_CACHE_ENABLED)
+
+# Срок хранения загрузок, результатов и отчетов: индекс файлов и фоновая очистка
+retention = RetentionManager([UPLOAD_FOLDER, RESULT_FOLDER, RENDER_FOLDER],
+                             max_age_hours=config.RETENTION_MAX_AGE_HOURS,
+                             max_total_bytes=config.RETENTION_MAX_BYTES,
+                             interval=config.RETENTION_INTERVAL)
+
+# Аннотированные изображения рисуются по запросу из оригинала и детекций
+result_renderer = ResultRenderer(db_manager, UPLOAD_FOLDER, RENDER_FOLDER,
+                                 sizes={'thumb': config.RESULT_THUMB_SIZE, 'full': 0},
+                                 quality=config.RESULT_IMAGE_QUALITY)
+
+# Детектор загружается при старте (MODEL_PRELOAD) или при первой детекции
+detector = None
+detector_lock = threading.Lock()
+
+def get_detector():
+    """Ленивое создание детектора с прогревочным инференсом"""
+    global detector
+    if detector is not None:
+        return detector
+    
+    with detector_lock:
+        if detector is None:
+            with timed(STARTUP_TIMINGS, 'model_load'):
+                instance = FruitDetector(config.MODEL_PATH, **detector_options)
+            if config.MODEL_WARMUP:
+                with timed(STARTUP_TIMINGS, 'warmup'):
+                    instance.warmup()
+            detector = instance
+    return detector
+
+# Реплики модели: каждый вызов инференса берет свободную реплику с ее бюджетом потоков
+detector_pool = None
+
+def get_detector_pool():
+    """Ленивое создание пула реплик (первая реплика - основной детектор)"""
+    global detector_pool
+    if detector_pool is not None:
+        return detector_pool
+    
+    primary = get_detector()
+    with detector_lock:
+        if detector_pool is None:
+            with timed(STARTUP_TIMINGS, 'replicas'):
+                pool = DetectorPool(lambda: FruitDetector(config.MODEL_PATH, **detector_options),
+                                    replicas=config.DETECTOR_REPLICAS,
+                                    threads=config.DETECTOR_THREADS,
+                                    pin_cores=config.DETECTOR_PIN_CORES,
+                                    primary=primary)
+                if config.MODEL_WARMUP and config.DETECTOR_REPLICAS > 1:
+                    pool.warmup()
+            detector_pool = pool
+    return detector_pool
+
+def _detect_batch(items):
+    """Пакетная детекция для планировщика: items - кортежи (изображение, путь, аннотировать)"""
+    images = [image for image, _, _ in items]
+    image_paths = [path for _, path, _ in items]
+    annotate = [flag for _, _, flag in items]
+    
+    # Этапы батча передаются каждому запросу вместе с его статистикой
+    tracer.begin()
+    try:
+        with get_detector_pool().checkout() as replica:
+            statistics = replica.detect_batch(images, image_paths, annotate)
+    finally:
+        stage_timings = tracer.end()
+    return [(stats, stage_timings) for stats in statistics]
+
+# Планировщик микробатчей: параллельные загрузки проходят через модель одним батчем,
+# батчи обрабатываются параллельно - по одному потоку на реплику модели
+batch_scheduler = None
+if config.BATCHING_ENABLED:
+    batch_scheduler = BatchScheduler(_detect_batch,
+                                     max_batch_size=config.BATCH_MAX_SIZE,
+                                     max_wait_ms=config.BATCH_MAX_WAIT_MS,
+                                     workers=config.DETECTOR_REPLICAS)
+
+def run_detection(filepath, annotate=True, data=None):
+    """
+    Детекция фруктов через планировщик батчей (если включен) или напрямую.
+    data - байты изображения в памяти: тогда файл filepath не читается
+    (и может не существовать), а используется только как имя
+    """
+    if batch_scheduler is None:
+        with get_detector_pool().checkout() as replica:
+            if data is not None:
+                return replica.detect_bytes(data, filepath, annotate)
+            return replica.detect_fruits(filepath, annotate)
+    
+    try:
+        # Декодируем изображение в потоке запроса, чтобы не нагружать поток батчинга
+        if data is not None:
+            img_array = get_detector().decode_image(data)
+        else:
+            img_array = get_detector().load_image(filepath)
+    except Exception as e:
+        print(f"Ошибка при загрузке изображения: {str(e)}")
+        return None
+    
+    # batch_wait - ожидание в очереди плюс обработка всего батча
+    with tracer.stage('batch_wait'):
+        statistics, stage_timings = batch_scheduler.submit((img_array, filepath, annotate)).result()
+    tracer.merge(stage_timings)
+    return statistics
+
+def finalize_request(statistics, processing_time, cache_key=None, stage_timings=None,
+                     render_later=False):
+    """
+    Сохранение результата детекции в БД и кэш, возвращает ID запроса.
+    render_later - результат отрисовывается лениво из сохраненного оригинала
+    """
+    if cache_key is not None and result_cache is not None:
+        result_cache.put(cache_key, {'statistics': statistics, 'render_later': render_later})
+    
+    request_id = db_manager.save_request(
+        filename=os.path.basename(statistics['original_image']),
+        statistics=statistics,
+        processing_time=processing_time,
+        stage_timings=stage_timings
+    )
+    
+    # Аннотированное изображение удалит фоновая очистка по истечении срока
+    retention.track(statistics.get('result_image'))
+    return request_id
+
+def finalize_job(statistics, processing_time, context=None, stage_timings=None):
+    """
+    Завершение асинхронной задачи: этапы из рабочего процесса попадают в гистограммы.
+    context - {'cache_key', 'render_later'} из upload_file; возвращает ID запроса,
+    если результат отрисовывается лениво (для ссылки на /results/<id>)
+    """
+    tracer.observe(stage_timings)
+    context = context or {}
+    request_id = finalize_request(statistics, processing_time,
+                                  context.get('cache_key'), stage_timings,
+                                  context.get('render_later', False))
+    return request_id if context.get('render_later') else None
+
+def cached_result_valid(cached):
+    """Изображение, нужное для результата из кэша, еще на диске"""
+    statistics = cached['statistics']
+    # При ленивой отрисовке результат рисуется из оригинала; загрузки
+    # без аннотаций файлов не требуют
+    image = statistics['result_image']
+    if not image and cached.get('render_later'):
+        image = statistics['original_image']
+    return not image or os.path.exists(image)
+
+def get_cached_result(cache_key):
+    """Статистика из кэша, если она есть и изображение для результата еще на диске"""
+    if result_cache is None:
+        return None
+    
+    cached = result_cache.get(cache_key, validate=cached_result_valid)
+    return cached['statistics'] if cached is not None else None
+
+def build_upload_result(statistics, processing_time, request_id=None):
+    """
+    Формирование ответа с результатами детекции.
+    request_id - ID запроса, результат которого отрисовывается лениво
+    """
+    result = format_statistics(statistics)
+    result['processing_time'] = round(processing_time, 2)
+    result['result_url'] = None
+    if statistics['result_image']:
+        result['result_url'] = url_for('static', 
+                                     filename=f'results/{os.path.basename(statistics["result_image"])}')
+    elif request_id is not None:
+        result['result_url'] = url_for('get_result_image', request_id=request_id)
+        result['thumbnail_url'] = url_for('get_result_image', request_id=request_id, size='thumb')
+    return result
+
+# Пул процессов для асинхронных загрузок создается при первом обращении
+job_queue = None
+job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Ленивое создание очереди задач (None, если асинхронный режим выключен)"""
+    global job_queue
+    if config.ASYNC_WORKERS <= 0:
+        return None
+    
+    with job_queue_lock:
+        if job_queue is None:
+            job_queue = JobQueue(workers=config.ASYNC_WORKERS,
+                                 max_pending=config.ASYNC_MAX_PENDING,
+                                 model_path=config.MODEL_PATH,
+                                 on_complete=finalize_job,
+                                 detector_options=detector_options,
+                                 detector=detector,
+                                 store=db_manager)
+    return job_queue
+
+def find_job(job_id):
+    """
+    Задача из очереди этого процесса или из общей таблицы jobs: при нескольких
+    рабочих процессах веб-сервера опрос может прийти не в тот, что принял загрузку
+    """
+    if job_queue is not None:
+        return job_queue.get(job_id)
+    return db_manager.get_job(job_id)
+
+def wait_job(job_id, timeout):
+    """Ожидание завершения задачи (не дольше timeout секунд)"""
+    if job_queue is not None:
+        return job_queue.wait(job_id, timeout=timeout)
+    return wait_stored_job(db_manager, job_id, timeout)
+
+def _detect_frames(frames):
+    """Пакетная детекция кадров видеопотоков без аннотаций"""
+    with get_detector_pool().checkout() as replica:
+        return replica.detect_arrays(frames)
+
+# Видеопотоки создаются при первом обращении и живут в процессе, который их принял
+stream_manager = None
+stream_manager_lock = threading.Lock()
+
+def get_stream_manager():
+    """Ленивое создание менеджера видеопотоков"""
+    global stream_manager
+    with stream_manager_lock:
+        if stream_manager is None:
+            stream_manager = StreamManager(_detect_frames,
+                                           max_streams=config.STREAMS_MAX,
+                                           max_batch_size=config.STREAMS_BATCH_SIZE,
+                                           max_wait_ms=config.STREAMS_BATCH_WAIT_MS,
+                                           workers=config.DETECTOR_REPLICAS)
+    return stream_manager
+
+def build_job_response(job):
+    """Формирование ответа о состоянии задачи"""
+    response = {
+        'job_id': job['id'],
+        'status': job['status']
+    }
+    if job['status'] == 'done':
+        response['result'] = build_upload_result(job['statistics'], job['processing_time'],
+                                                 job['request_id'])
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return response
 
 @app.route('/')
+@response_cache.cached
 def index():
     """Главная страница"""
     # Получаем историю запросов
-    history = db_manager.get_all_requests()[:10]  # Последние 10 запросов
+    history = db_manager.get_recent_requests(10)  # Последние 10 запросов
     
     # Получаем ежедневную статистику
     daily_stats = db_manager.get_daily_statistics()
     
     return render_template('index.html', 
                          history=history, 
-                         daily_stats=daily_stats)
+                         daily_stats=daily_stats,
+                         async_uploads=config.UI_ASYNC_UPLOADS and config.ASYNC_WORKERS > 0)
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Обработка загрузки изображения"""
+    # Трассировка этапов запроса: сохраняется в БД и попадает в /metrics
+    request_start = time.perf_counter()
+    tracer.begin()
     try:
+        if request.content_length and request.content_length > UPLOAD_MAX_CONTENT_LENGTH:
+            return jsonify({'error': 'File is too large'}), 413
+        
         # Проверяем наличие файла
         if 'file' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
@@ -51,16 +360,75 @@ def upload_file():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        # Сохраняем файл
-        filepath = save_uploaded_file(file, UPLOAD_FOLDER)
-        if not filepath:
+        if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type'}), 400
         
+        # Без аннотаций возвращаются только счетчики (без отрисовки и записи изображения)
+        annotate = request.values.get('annotate', '1') not in ('0', 'false')
+        # Ленивая отрисовка: рамки рисуются при первом GET /results/<id>,
+        # при загрузке сохраняются только оригинал (без перекодирования) и детекции
+        render_later = annotate and config.LAZY_RESULTS
+        request_annotate = annotate and not render_later
+        
         # Засекаем время обработки
         start_time = time.time()
         
+        # Загрузка читается в память один раз: для ключа кэша и для декодирования.
+        # Лимит проверяется по прочитанным байтам: у chunked-запроса нет Content-Length
+        data = read_limited(file, UPLOAD_MAX_CONTENT_LENGTH)
+        if data is None:
+            return jsonify({'error': 'File is too large'}), 413
+        
+        # Повторно загруженное изображение отдаем из кэша без детекции и сохранения файла
+        cache_key = None
+        if result_cache is not None:
+            with tracer.stage('cache_lookup'):
+                cache_key = ResultCache.make_key(
+                    data, f"{get_detector().config_fingerprint()}:{int(annotate)}")
+                statistics = get_cached_result(cache_key)
+            
+            if statistics is not None:
+                processing_time = time.time() - start_time
+                request_id = finalize_request(statistics, processing_time,
+                                              stage_timings=tracer.current())
+                
+                result = build_upload_result(statistics, processing_time,
+                                             request_id if render_later else None)
+                result['cached'] = True
+                return jsonify(result)
+        
+        filepath = os.path.join(UPLOAD_FOLDER, make_upload_filename(file.filename))
+        
+        # Асинхронный режим: сразу возвращаем ID задачи
+        if request.values.get('async') in ('1', 'true'):
+            queue = get_job_queue()
+            if queue is not None:
+                # Рабочие процессы получают изображение через файл
+                save_upload_data(data, filepath)
+                retention.track(filepath)
+                try:
+                    job_id = queue.submit(filepath, request_annotate,
+                                          {'cache_key': cache_key, 'render_later': render_later})
+                except QueueFullError:
+                    response = jsonify({'error': 'Server is busy, try again later'})
+                    response.headers['Retry-After'] = '1'
+                    return response, 429
+                
+                return jsonify({
+                    'job_id': job_id,
+                    'status': 'queued',
+                    'status_url': url_for('get_job', job_id=job_id),
+                    'events_url': url_for('get_job_events', job_id=job_id)
+                }), 202
+        
+        # Оригинал сохраняется на диск по настройке или для ленивой отрисовки,
+        # детекция идет из памяти
+        if config.PERSIST_UPLOADS or render_later:
+            save_upload_data(data, filepath)
+            retention.track(filepath)
+        
         # Детекция фруктов
-        statistics = detector.detect_fruits(filepath)
+        statistics = run_detection(filepath, request_annotate, data)
         
         if not statistics:
             return jsonify({'error': 'Failed to process image'}), 500
@@ -68,87 +436,255 @@ def upload_file():
         processing_time = time.time() - start_time
         
         # Сохраняем запрос в базу данных
-        db_manager.save_request(
-            filename=os.path.basename(filepath),
-            statistics=statistics,
-            processing_time=processing_time
-        )
+        request_id = finalize_request(statistics, processing_time, cache_key, tracer.current(),
+                                      render_later)
         
         # Форматируем результат
-        result = format_statistics(statistics)
-        result['processing_time'] = round(processing_time, 2)
-        result['result_url'] = url_for('static', 
-                                     filename=f'results/{os.path.basename(statistics["result_image"])}')
-        
-        # Очищаем старые файлы
-        cleanup_old_files(UPLOAD_FOLDER)
-        cleanup_old_files(RESULT_FOLDER)
+        result = build_upload_result(statistics, processing_time,
+                                     request_id if render_later else None)
         
         return jsonify(result)
         
     except Exception as e:
         print(f"Error processing upload: {str(e)}")
         return jsonify({'error': str(e)}), 500
+        
+    finally:
+        tracer.end()
+        if tracer.enabled:
+            tracer.record('request', time.perf_counter() - request_start)
+
+@app.route('/upload/bulk', methods=['POST'])
+def upload_bulk():
+    """
+    Пакетная загрузка: много файлов (поле files) и/или архивы ZIP/TAR.
+    Изображения проходят через модель батчами, результаты отдаются
+    построчно (NDJSON) по мере готовности, все запросы сохраняются
+    в БД одной транзакцией, последняя строка - суммарные счетчики
+    """
+    files = request.files.getlist('files') + request.files.getlist('file')
+    files = [file for file in files if file.filename]
+    if not files:
+        return jsonify({'error': 'No files uploaded'}), 400
+    
+    annotate = request.values.get('annotate', '1') not in ('0', 'false')
+    
+    # Файлы формы закрываются вместе с запросом, а ответ потоковый
+    uploads = [(file.filename, spool(file.stream)) for file in files
+               if is_archive(file.filename) or allowed_file(file.filename)]
+    
+    limit_errors = []
+    
+    def images():
+        unpacked = 0
+        for filename, stream in uploads:
+            try:
+                if is_archive(filename):
+                    # Каждый файл архива ограничен как одиночная загрузка,
+                    # все распакованные файлы запроса - как пакетный запрос
+                    remaining = max(1, config.BULK_MAX_CONTENT_LENGTH - unpacked)
+                    entries = iter_archive(stream, filename,
+                                           max_entry_bytes=UPLOAD_MAX_CONTENT_LENGTH,
+                                           max_total_bytes=remaining)
+                else:
+                    entries = [(filename, read_limited(stream, UPLOAD_MAX_CONTENT_LENGTH))]
+                for name, data in entries:
+                    unpacked += len(data or b'')
+                    yield name, data
+            except ArchiveLimitError as e:
+                # Остаток запроса отбрасывается, уже прочитанные изображения обрабатываются
+                limit_errors.append(str(e))
+                return
+            finally:
+                stream.close()
+    
+    def generate():
+        summary = BulkSummary()
+        saved = []
+        # Изображения декодирует основной детектор, батчи идут в свободную реплику
+        pool = get_detector_pool()
+        for name, statistics, processing_time in detect_stream(pool.primary, images(),
+                                                               UPLOAD_FOLDER,
+                                                               config.BATCH_MAX_SIZE, annotate,
+                                                               checkout=pool.checkout):
+            summary.add(statistics)
+            if not statistics:
+                yield json.dumps({'type': 'error', 'filename': name,
+                                  'error': 'Failed to process image'}) + '\n'
+                continue
+            
+            retention.track(statistics['result_image'])
+            saved.append((os.path.basename(statistics['original_image']),
+                          statistics, processing_time))
+            
+            result = build_upload_result(statistics, processing_time)
+            result['type'] = 'result'
+            result['filename'] = name
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+        
+        for error in limit_errors:
+            yield json.dumps({'type': 'error', 'error': error}) + '\n'
+        
+        # Одна транзакция на всю пачку вместо коммита на каждое изображение
+        result = summary.to_dict()
+        result['request_ids'] = db_manager.save_requests(saved)
+        yield json.dumps(result, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Состояние асинхронной задачи"""
+    job = find_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(build_job_response(job))
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def get_job_events(job_id):
+    """Поток событий (SSE) о состоянии асинхронной задачи"""
+    if find_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        last_status = None
+        while True:
+            job = wait_job(job_id, timeout=15)
+            if job is None:
+                break
+            
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"data: {json.dumps(build_job_response(job))}\n\n"
+            else:
+                # Комментарий поддерживает соединение открытым
+                yield ": keep-alive\n\n"
+            
+            if job['status'] in ('done', 'failed'):
+                break
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+# Ограничения размера страницы истории
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 500
 
 @app.route('/history', methods=['GET'])
+@response_cache.cached
 def get_history():
-    """Получение истории запросов"""
+    """
+    Получение истории запросов постранично (от новых к старым).
+    Параметры: before_id, limit, date_from, date_to, fruit, fields
+    """
     try:
-        history = db_manager.get_all_requests()
-        return jsonify(history)
+        try:
+            before_id = request.args.get('before_id')
+            before_id = int(before_id) if before_id else None
+            limit = int(request.args.get('limit', HISTORY_DEFAULT_LIMIT))
+        except ValueError:
+            return jsonify({'error': 'Invalid pagination parameters'}), 400
+        
+        limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+        fields = request.args.get('fields')
+        fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        
+        try:
+            history, next_before_id = db_manager.get_requests_page(
+                before_id=before_id,
+                limit=limit,
+                date_from=request.args.get('date_from'),
+                date_to=request.args.get('date_to'),
+                fruit=request.args.get('fruit'),
+                fields=fields
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = jsonify(history)
+        # Курсор следующей страницы передаем в заголовках, тело остается списком
+        if next_before_id is not None:
+            args = request.args.to_dict()
+            args['before_id'] = next_before_id
+            response.headers['X-Next-Before-Id'] = str(next_before_id)
+            response.headers['Link'] = f'<{url_for("get_history", **args)}>; rel="next"'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def build_report_response(report_path):
+    """Ответ со ссылкой на готовый отчет"""
+    # Отчет хранится, пока его запрашивают; удаленный будет сгенерирован заново
+    retention.track(report_path)
+    return {
+        'status': 'ready',
+        'report_url': url_for('static', 
+                            filename=f'results/{os.path.basename(report_path)}'),
+        'filename': os.path.basename(report_path)
+    }
+
 @app.route('/generate_report', methods=['POST'])
 def generate_report():
     """Генерация отчета"""
     try:
         data = request.json
         report_type = data.get('type', 'pdf')
+        if report_type not in REPORT_FORMATS:
+            return jsonify({'error': 'Invalid report type'}), 400
         
-        # Получаем последний запрос для отчета
-        history = db_manager.get_all_requests()
-        if not history:
+        # Получаем последний запрос для отчета (одна строка)
+        latest_request = db_manager.get_latest_request()
+        if not latest_request:
             return jsonify({'error': 'No data available for report'}), 400
         
-        latest_request = history[0]
-        
-        # Генерируем отчет
-        if report_type == 'pdf':
-            report_path = report_gen.generate_pdf_report(
-                statistics={
-                    'total_fruits': latest_request['total_fruits'],
-                    'fruit_counts': latest_request['fruit_counts']
-                },
-                request_data=latest_request
-            )
-        elif report_type == 'excel':
-            report_path = report_gen.generate_excel_report(
-                statistics={
-                    'total_fruits': latest_request['total_fruits'],
-                    'fruit_counts': latest_request['fruit_counts']
-                },
-                request_data=latest_request
-            )
-        else:
-            return jsonify({'error': 'Invalid report type'}), 400
+        # Генерируем отчет в фоне (или берем готовый)
+        future = report_service.request_report(latest_request, report_type)
+        try:
+            report_path = future.result(timeout=config.REPORT_WAIT_SECONDS)
+        except FutureTimeoutError:
+            # Отчет еще готовится: клиент может опросить состояние
+            return jsonify({
+                'status': 'pending',
+                'status_url': url_for('get_report_status',
+                                      request_id=latest_request['id'],
+                                      report_type=report_type)
+            }), 202
         
         # Возвращаем путь к отчету
-        return jsonify({
-            'report_url': url_for('static', 
-                                filename=f'results/{os.path.basename(report_path)}'),
-            'filename': os.path.basename(report_path)
-        })
+        return jsonify(build_report_response(report_path))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/reports/<int:request_id>/<report_type>', methods=['GET'])
+def get_report_status(request_id, report_type):
+    """Состояние фоновой генерации отчета"""
+    if report_type not in REPORT_FORMATS:
+        return jsonify({'error': 'Invalid report type'}), 400
+    
+    status = report_service.get_status(request_id, report_type)
+    if status is None:
+        return jsonify({'error': 'Report not found'}), 404
+    if status == 'pending':
+        return jsonify({'status': 'pending'}), 202
+    
+    return jsonify(build_report_response(report_service.report_path(request_id, report_type)))
+
 @app.route('/generate_history_report', methods=['GET'])
 def generate_history_report():
     """Генерация отчета по всей истории"""
     try:
-        history = db_manager.get_all_requests()
-        report_path = report_gen.generate_history_report(history)
+        report_format = request.args.get('format', 'xlsx')
+        if report_format not in HISTORY_FORMATS:
+            return jsonify({'error': 'Invalid report format'}), 400
+        if not history_format_available(report_format):
+            return jsonify({'error': f'Format {report_format} is not available on this server'}), 501
+        
+        # История читается из БД порциями и сразу пишется в файл
+        report_path = report_gen.generate_history_report(db_manager.iter_requests(),
+                                                         report_format)
+        retention.track(report_path)
         
         return jsonify({
             'report_url': url_for('static', 
@@ -159,21 +695,35 @@ def generate_history_report():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/download_history_report', methods=['GET'])
+def download_history_report():
+    """Потоковая выгрузка отчета по всей истории (chunked HTTP ответ)"""
+    report_format = request.args.get('format', 'xlsx')
+    if report_format not in HISTORY_FORMATS:
+        return jsonify({'error': 'Invalid report format'}), 400
+    if not history_format_available(report_format):
+        return jsonify({'error': f'Format {report_format} is not available on this server'}), 501
+    
+    filename = f"history_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{report_format}"
+    chunks = report_gen.stream_history_report(db_manager.iter_requests(), report_format)
+    
+    return Response(stream_with_context(chunks),
+                    mimetype=HISTORY_FORMATS[report_format],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 @app.route('/statistics', methods=['GET'])
+@response_cache.cached
 def get_statistics():
     """Получение статистики"""
     try:
-        # Общая статистика
-        history = db_manager.get_all_requests()
+        # Общая статистика из инкрементальных агрегатов
+        summary = db_manager.get_summary_statistics()
         
-        total_requests = len(history)
-        total_fruits = sum(req['total_fruits'] for req in history)
+        total_requests = summary['total_requests']
+        total_fruits = summary['total_fruits']
         
         # Статистика по фруктам
-        fruit_stats = {}
-        for req in history:
-            for fruit, count in req['fruit_counts'].items():
-                fruit_stats[fruit] = fruit_stats.get(fruit, 0) + count
+        fruit_stats = summary['fruit_counts']
         
         # Самый популярный фрукт
         most_common = max(fruit_stats.items(), key=lambda x: x[1]) if fruit_stats else ('Нет данных', 0)
@@ -192,6 +742,220 @@ def get_statistics():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/statistics/fruits', methods=['GET'])
+@response_cache.cached
+def get_fruit_statistics():
+    """Статистика по фруктам за период или по дням для одного фрукта"""
+    try:
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+        fruit = request.args.get('fruit')
+        
+        if fruit:
+            daily = db_manager.get_daily_fruit_counts(fruit, date_from, date_to)
+            return jsonify({
+                'fruit': fruit,
+                'daily': [{'date': date, 'count': count} for date, count in daily]
+            })
+        
+        return jsonify({
+            'fruit_statistics': db_manager.get_fruit_statistics(date_from, date_to)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/batching/stats', methods=['GET'])
+def get_batching_stats():
+    """Гистограммы размера батча и времени ожидания в очереди"""
+    if batch_scheduler is None:
+        return jsonify({'enabled': False})
+    
+    stats = batch_scheduler.stats()
+    stats['enabled'] = True
+    return jsonify(stats)
+
+@app.route('/replicas/stats', methods=['GET'])
+def get_replica_stats():
+    """Раскладка реплик модели по потокам и ядрам, их загрузка"""
+    if detector_pool is None:
+        return jsonify({'loaded': False})
+    
+    stats = detector_pool.stats()
+    stats['loaded'] = True
+    return jsonify(stats)
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Счетчики попаданий и промахов кэша результатов"""
+    if result_cache is None:
+        return jsonify({'enabled': False})
+    
+    stats = result_cache.stats()
+    stats['enabled'] = True
+    return jsonify(stats)
+
+@app.route('/cache/responses/stats', methods=['GET'])
+def get_response_cache_stats():
+    """Счетчики кэша ответов панели"""
+    stats = response_cache.stats()
+    stats['enabled'] = response_cache.enabled
+    return jsonify(stats)
+
+@app.route('/retention/stats', methods=['GET'])
+def get_retention_stats():
+    """Состояние индекса хранимых файлов"""
+    return jsonify(retention.stats())
+
+@app.route('/streams', methods=['POST'])
+def add_stream():
+    """
+    Запуск обработки видеопотока. JSON: source (путь к файлу, RTSP URL
+    или номер камеры из FRUIT_STREAM_SOURCES), frame_interval, realtime,
+    count_line, count_axis, adaptive (выбор кадров для модели по движению)
+    """
+    data = request.get_json(silent=True) or {}
+    source = data.get('source')
+    if source is None or source == '':
+        return jsonify({'error': 'source is required'}), 400
+    if not isinstance(source, (str, int)) or isinstance(source, bool):
+        return jsonify({'error': 'source must be a string or a camera number'}), 400
+    # Источник открывает OpenCV: произвольные пути и URL не принимаются
+    if not allowed_stream_source(source, config.STREAM_SOURCES):
+        return jsonify({'error': 'Stream source is not allowed'}), 403
+    if isinstance(source, str) and source.isdigit():
+        # Номер локальной камеры
+        source = int(source)
+    
+    count_axis = data.get('count_axis', 'y')
+    if count_axis not in ('x', 'y'):
+        return jsonify({'error': 'count_axis must be x or y'}), 400
+    try:
+        frame_interval = int(data.get('frame_interval', 1))
+        count_line = data.get('count_line')
+        count_line = float(count_line) if count_line is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid stream parameters'}), 400
+    
+    sampler = None
+    if data.get('adaptive'):
+        sampler = MotionSampler(config.VIDEO_MIN_INTERVAL, config.VIDEO_MAX_INTERVAL,
+                                config.VIDEO_MOTION_THRESHOLD)
+    
+    try:
+        stream_id = get_stream_manager().add(source,
+                                             frame_interval=frame_interval,
+                                             realtime=bool(data.get('realtime', False)),
+                                             count_line=count_line,
+                                             count_axis=count_axis,
+                                             sampler=sampler)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 429
+    
+    return jsonify(get_stream_manager().get(stream_id)), 201
+
+@app.route('/streams', methods=['GET'])
+def list_streams():
+    """Живые счетчики всех видеопотоков и статистика общего планировщика"""
+    manager = get_stream_manager()
+    return jsonify({
+        'streams': manager.list(),
+        'scheduler': manager.stats()
+    })
+
+@app.route('/streams/<stream_id>', methods=['GET'])
+def get_stream(stream_id):
+    """Живые счетчики видеопотока"""
+    stream = get_stream_manager().get(stream_id)
+    if stream is None:
+        return jsonify({'error': 'Stream not found'}), 404
+    return jsonify(stream)
+
+@app.route('/streams/<stream_id>', methods=['DELETE'])
+def delete_stream(stream_id):
+    """Остановка видеопотока, возвращает итоговые счетчики"""
+    stream = get_stream_manager().remove(stream_id)
+    if stream is None:
+        return jsonify({'error': 'Stream not found'}), 404
+    return jsonify(stream)
+
+@app.route('/results/<int:request_id>', methods=['GET'])
+def get_result_image(request_id):
+    """
+    Аннотированное изображение запроса, отрисованное при первом обращении.
+    Параметры: size (thumb, full)
+    """
+    size = request.args.get('size', 'full')
+    if size not in result_renderer.sizes:
+        return jsonify({'error': 'Invalid size'}), 400
+    
+    image_format = config.RESULT_IMAGE_FORMAT
+    if image_format == 'auto':
+        image_format = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    
+    try:
+        path = result_renderer.render(request_id, size, image_format)
+    except Exception as e:
+        print(f"Ошибка при отрисовке результата: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    if path is None:
+        return jsonify({'error': 'Result not found'}), 404
+    
+    # Отрисованное изображение хранится, пока его запрашивают
+    retention.track(path)
+    response = send_file(os.path.abspath(path), mimetype=IMAGE_MIMETYPES[image_format],
+                         max_age=config.RESULT_IMAGE_MAX_AGE, conditional=True)
+    if config.RESULT_IMAGE_FORMAT == 'auto':
+        response.vary.add('Accept')
+    return response
+
+@app.route('/requests/<int:request_id>/timings', methods=['GET'])
+def get_request_timings(request_id):
+    """Длительности этапов обработки сохраненного запроса"""
+    return jsonify({
+        'request_id': request_id,
+        'timings': db_manager.get_stage_timings(request_id)
+    })
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    lines = tracer.prometheus()
+    
+    if batch_scheduler is not None:
+        lines.append('# TYPE fruit_batch_size histogram')
+        lines.extend(batch_scheduler.batch_size_histogram.prometheus('fruit_batch_size'))
+        lines.append('# TYPE fruit_batch_queue_wait_seconds histogram')
+        lines.extend(batch_scheduler.queue_wait_histogram.prometheus(
+            'fruit_batch_queue_wait_seconds'))
+    
+    if result_cache is not None:
+        cache_stats = result_cache.stats()
+        lines.append('# TYPE fruit_result_cache_hits_total counter')
+        lines.append(f"fruit_result_cache_hits_total {cache_stats['hits']}")
+        lines.append('# TYPE fruit_result_cache_misses_total counter')
+        lines.append(f"fruit_result_cache_misses_total {cache_stats['misses']}")
+    
+    return Response('\n'.join(lines) + '\n',
+                    mimetype='text/plain; version=0.0.4')
+
+@app.route('/startup/stats', methods=['GET'])
+def get_startup_stats():
+    """Длительность этапов запуска приложения"""
+    return jsonify({
+        'pid': os.getpid(),
+        'model_loaded': detector is not None,
+        'timings': STARTUP_TIMINGS
+    })
+
+# Предзагрузка модели: при запуске через prefork-сервер с --preload
+# рабочие процессы получают уже загруженные веса (copy-on-write)
+if config.MODEL_PRELOAD:
+    get_detector_pool()
+
+STARTUP_TIMINGS['total'] = round(time.perf_counter() - _startup_begin, 4)
+
 if __name__ == '__main__':
     print("Запуск приложения для подсчета фруктов...")
     print("Модель YOLOv8 загружается... Это может занять некоторое время при первом запуске.")
@@ -0,0 +1,99 @@
+import importlib.util
+import os
+
+# Бэкенды инференса: имя -> параметры экспорта ultralytics (None - исходные веса PyTorch)
+BACKENDS = {
+    'torch': None,
+    'onnx': {'format': 'onnx', 'dynamic': True},
+    'onnx-int8': {'format': 'onnx', 'dynamic': True},
+    'openvino': {'format': 'openvino', 'dynamic': True},
+    'openvino-int8': {'format': 'openvino', 'dynamic': True, 'int8': True}
+}
+
+# Пакеты, без которых бэкенд не запустится.
+# INT8-экспорт OpenVINO квантует модель через NNCF по калибровочному набору
+# изображений (параметр calibration_data в prepare_model)
+BACKEND_REQUIREMENTS = {
+    'onnx': ('onnxruntime',),
+    'onnx-int8': ('onnxruntime',),
+    'openvino': ('openvino',),
+    'openvino-int8': ('openvino', 'nncf')
+}
+
+
+def backend_available(backend):
+    """Проверка, что бэкенд известен и его зависимости установлены"""
+    if backend not in BACKENDS:
+        return False
+    return all(importlib.util.find_spec(requirement) is not None
+               for requirement in BACKEND_REQUIREMENTS.get(backend, ()))
+
+
+def backend_model_path(model_path, backend, export_dir=None):
+    """Путь к экспортированной модели бэкенда (файл или каталог OpenVINO)"""
+    if BACKENDS[backend] is None:
+        return model_path
+
+    export_dir = export_dir or os.path.dirname(model_path) or '.'
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    names = {
+        'onnx': f'{stem}.onnx',
+        'onnx-int8': f'{stem}.int8.onnx',
+        'openvino': f'{stem}_openvino_model',
+        'openvino-int8': f'{stem}_int8_openvino_model'
+    }
+    return os.path.join(export_dir, names[backend])
+
+
+def prepare_model(model_path, backend='torch', export_dir=None, calibration_data=None):
+    """
+    Подготовка модели для бэкенда: экспорт выполняется один раз,
+    дальше используется сохраненный результат.
+    calibration_data - YAML набора данных ultralytics с изображениями для
+    калибровки openvino-int8 (лучше всего - снимки фруктов из рабочей среды);
+    без него ultralytics скачивает пример COCO (coco8.yaml).
+    Возвращает путь, который можно передать в YOLO(...)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown inference backend: {backend}')
+    if not backend_available(backend):
+        raise RuntimeError(f"Backend {backend} requires {', '.join(BACKEND_REQUIREMENTS[backend])}")
+
+    target = backend_model_path(model_path, backend, export_dir)
+    if BACKENDS[backend] is None or os.path.exists(target):
+        return target
+
+    if backend == 'onnx-int8':
+        _quantize_onnx(prepare_model(model_path, 'onnx', export_dir), target)
+        return target
+
+    export_options = dict(BACKENDS[backend])
+    if export_options.get('int8') and calibration_data:
+        export_options['data'] = calibration_data
+
+    from ultralytics import YOLO
+    exported = YOLO(model_path).export(**export_options)
+
+    # Переносим результат экспорта под постоянное имя
+    exported = str(exported).rstrip('/\\')
+    if os.path.abspath(exported) != os.path.abspath(target):
+        os.replace(exported, target)
+    return target
+
+
+def _quantize_onnx(source_path, target_path):
+    """Динамическое INT8-квантование весов ONNX модели"""
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    temp_path = f'{target_path}.tmp'
+    quantize_dynamic(source_path, temp_path, weight_type=QuantType.QUInt8)
+
+    # Метаданные (имена классов, stride) нужны ultralytics для разбора выхода
+    source = onnx.load(source_path)
+    quantized = onnx.load(temp_path)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source.metadata_props)
+    onnx.save(quantized, temp_path)
+
+    os.replace(temp_path, target_path)
@@ -0,0 +1,146 @@
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+from metrics import Histogram
+
+# Границы корзин для гистограмм планировщика
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+QUEUE_WAIT_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+
+
+def _restart_after_fork(ref):
+    """Перезапуск потока объекта в дочернем процессе после fork"""
+    instance = ref()
+    if instance is not None and not instance._stopped:
+        instance._start()
+
+
+class BatchScheduler:
+    """
+    Динамический микробатчинг: собирает входящие задачи в батч
+    (до max_batch_size штук или до истечения max_wait_ms с момента
+    поступления первой задачи) и обрабатывает его одним вызовом batch_fn.
+
+    batch_fn принимает список элементов и возвращает список результатов
+    той же длины и в том же порядке.
+
+    workers - число потоков, которые собирают и обрабатывают батчи из общей
+    очереди параллельно (например, по одному на реплику модели в DetectorPool)
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=10, name='inference',
+                 workers=1):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.name = name
+        self.workers = max(1, int(workers))
+
+        self._stopped = False
+
+        # Гистограммы для подбора баланса пропускной способности и p99
+        self.batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_histogram = Histogram(QUEUE_WAIT_BUCKETS)
+
+        self._start()
+
+        # Потоки не переживают fork: в дочернем процессе (prefork-сервер
+        # с предзагрузкой приложения) планировщик запускается заново
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: _restart_after_fork(ref))
+
+    def _start(self):
+        """Создание очереди и запуск потоков планировщика"""
+        self._queue = queue.Queue()
+        self._threads = [threading.Thread(target=self._run,
+                                          name=f'{self.name}-batcher-{index}',
+                                          daemon=True)
+                         for index in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, item):
+        """Постановка задачи в очередь, возвращает Future с результатом"""
+        if self._stopped:
+            raise RuntimeError('BatchScheduler is closed')
+
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def _collect_batch(self):
+        """Сбор одного батча из очереди"""
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = first[2] + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    entry = self._queue.get(timeout=remaining)
+                else:
+                    # Окно истекло - забираем только то, что уже лежит в очереди
+                    entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if entry is None:
+                # Возвращаем сигнал остановки, чтобы завершить цикл после батча
+                self._queue.put(None)
+                break
+            batch.append(entry)
+
+        return batch
+
+    def _run(self):
+        """Основной цикл потока планировщика"""
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                # Сигнал остановки нужен и остальным потокам
+                self._queue.put(None)
+                break
+
+            started = time.perf_counter()
+            self.batch_size_histogram.observe(len(batch))
+            for _, _, enqueued in batch:
+                self.queue_wait_histogram.observe(started - enqueued)
+
+            items = [entry[0] for entry in batch]
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        """Статистика работы планировщика"""
+        return {
+            'name': self.name,
+            'workers': self.workers,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': round(self.max_wait * 1000, 3),
+            'queue_depth': self._queue.qsize(),
+            'batch_size': self.batch_size_histogram.snapshot(),
+            'queue_wait_seconds': self.queue_wait_histogram.snapshot()
+        }
+
+    def close(self):
+        """Остановка планировщика после обработки уже поставленных задач"""
+        if not self._stopped:
+            self._stopped = True
+            self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,109 @@
+"""
+Бенчмарк бэкендов инференса FruitDetector на одном наборе изображений:
+изображений в секунду, задержка p50/p99 и сверка подсчетов с PyTorch.
+
+Запуск из корня проекта:
+    python benchmarks/bench_backends.py --images static/uploads --backends torch onnx openvino
+    python benchmarks/bench_backends.py --images static/uploads --check-parity
+
+С --check-parity скрипт завершается с кодом 1, если подсчеты
+какого-либо бэкенда расходятся с PyTorch
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import BACKENDS, backend_available
+from fruit_detector import FruitDetector
+from timing import percentile
+from utils import allowed_file
+
+
+def load_images(detector, images_dir, limit):
+    """Декодирование набора изображений один раз для всех бэкендов"""
+    paths = sorted(os.path.join(images_dir, name) for name in os.listdir(images_dir)
+                   if allowed_file(name))[:limit]
+    return [(os.path.basename(path), detector.load_image(path)) for path in paths]
+
+
+def run(backend, model_path, images, repeat, warmup):
+    """Один прогон бэкенда: прогрев, затем repeat проходов по набору"""
+    detector = FruitDetector(model_path, backend=backend, tile_mode='off')
+
+    for _, img_array in images[:warmup]:
+        detector.detect_image(img_array, annotate=False)
+
+    latencies = []
+    counts = {}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for name, img_array in images:
+            started = time.perf_counter()
+            statistics = detector.detect_image(img_array, annotate=False)
+            latencies.append(time.perf_counter() - started)
+            counts[name] = statistics['fruit_counts']
+    elapsed = time.perf_counter() - start
+
+    return {
+        'backend': backend,
+        'images': len(images) * repeat,
+        'images_per_second': round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency_p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 2)
+    }, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк бэкендов инференса')
+    parser.add_argument('--images', required=True, help='Каталог с изображениями')
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS))
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--check-parity', action='store_true',
+                        help='Сверить подсчеты с PyTorch и вернуть код 1 при расхождении')
+    args = parser.parse_args()
+
+    backends = list(args.backends)
+    if args.check_parity and 'torch' not in backends:
+        backends.insert(0, 'torch')
+
+    images = None
+    results = []
+    counts_by_backend = {}
+    for backend in backends:
+        if not backend_available(backend):
+            results.append({'backend': backend, 'skipped': 'dependencies not installed'})
+            continue
+        if images is None:
+            images = load_images(FruitDetector(args.model), args.images, args.limit)
+        result, counts = run(backend, args.model, images, args.repeat, args.warmup)
+        results.append(result)
+        counts_by_backend[backend] = counts
+
+    # Сверка подсчетов с эталонным путем PyTorch
+    reference = counts_by_backend.get('torch')
+    parity_ok = True
+    if reference is not None:
+        for result in results:
+            counts = counts_by_backend.get(result['backend'])
+            if counts is None:
+                continue
+            mismatches = sorted(name for name in reference if counts.get(name) != reference[name])
+            result['count_mismatches'] = len(mismatches)
+            if mismatches:
+                result['mismatched_images'] = mismatches[:10]
+                parity_ok = False
+
+    print(json.dumps(results, indent=2))
+    if args.check_parity and not parity_ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Бенчмарк слоя доступа к SQLite: скорость вставок save_request
+и задержка чтения во время параллельной записи.
+
+Запуск из корня проекта:
+    python benchmarks/bench_database.py --writers 8 --duration 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+from timing import percentile
+
+FRUITS = ['apple', 'orange', 'banana', 'carrot', 'broccoli']
+
+
+def make_statistics(rng):
+    """Синтетический результат детекции"""
+    fruit_counts = {fruit: rng.randint(1, 20)
+                    for fruit in rng.sample(FRUITS, rng.randint(1, 3))}
+    return {
+        'total_fruits': sum(fruit_counts.values()),
+        'fruit_counts': fruit_counts,
+        'result_image': 'static/results/result_bench.jpg'
+    }
+
+
+def run(batch_writes, writers, duration):
+    """Один прогон: writers потоков пишут, один поток читает"""
+    db_dir = tempfile.mkdtemp(prefix='fruit_bench_')
+    db = DatabaseManager(os.path.join(db_dir, 'bench.db'), batch_writes=batch_writes)
+
+    stop = threading.Event()
+    inserts = [0] * writers
+    errors = []
+    read_latencies = []
+
+    def writer(index):
+        rng = random.Random(index)
+        while not stop.is_set():
+            try:
+                db.save_request('bench.jpg', make_statistics(rng), 0.05)
+                inserts[index] += 1
+            except Exception as e:
+                errors.append(str(e))
+
+    def reader():
+        while not stop.is_set():
+            start = time.perf_counter()
+            db.get_summary_statistics()
+            db.get_recent_requests(10)
+            read_latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads.append(threading.Thread(target=reader))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    db.close()
+
+    return {
+        'batch_writes': batch_writes,
+        'writers': writers,
+        'inserts_per_second': round(sum(inserts) / duration, 1),
+        'read_p50_ms': round(percentile(read_latencies, 0.5) * 1000, 3),
+        'read_p99_ms': round(percentile(read_latencies, 0.99) * 1000, 3),
+        'errors': len(errors)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк DatabaseManager')
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    results = [run(batch_writes, args.writers, args.duration)
+               for batch_writes in (False, True)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
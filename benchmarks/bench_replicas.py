@@ -0,0 +1,194 @@
+"""
+Бенчмарк раскладки реплик модели по ядрам: для каждого варианта
+"реплики x потоки" clients параллельных клиентов отправляют изображения
+через DetectorPool, замеряются общая пропускная способность и задержка
+p50/p95/p99 (ожидание свободной реплики входит в задержку).
+
+По умолчанию варианты строятся из числа доступных ядер: 1xN, 2xN/2, 4xN/4...
+
+С --mode upload запросы идут через настоящий путь POST /upload (планировщик
+микробатчей и пул реплик приложения); каждый вариант запускается в отдельном
+процессе, потому что приложение читает настройки при импорте.
+
+Запуск из корня проекта:
+    python benchmarks/bench_replicas.py --clients 16 --requests 400
+    python benchmarks/bench_replicas.py --splits 1x16 2x8 4x4 8x2 --pin-cores
+    python benchmarks/bench_replicas.py --mode upload --splits 1x8 2x4 4x2
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detector_pool import DetectorPool
+from fruit_detector import FruitDetector
+from synthetic import make_image
+from timing import percentile
+
+
+def default_splits():
+    """Варианты replicas x threads, которые делят все ядра поровну"""
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') \
+        else (os.cpu_count() or 1)
+    splits = []
+    replicas = 1
+    while replicas <= cores:
+        splits.append((replicas, cores // replicas))
+        replicas *= 2
+    return splits
+
+
+def parse_split(value):
+    """'4x2' -> (4, 2)"""
+    replicas, threads = value.lower().split('x')
+    return int(replicas), int(threads)
+
+
+def measure(call, args, make_client=None):
+    """
+    args.requests вызовов call(client, index) от args.clients параллельных
+    клиентов; make_client() создает состояние клиента (по умолчанию None)
+    """
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def client():
+        state = make_client() if make_client is not None else None
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            started = time.perf_counter()
+            call(state, index)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(args.clients)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'clients': args.clients,
+        'requests': len(latencies),
+        'images_per_second': round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency_p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'latency_p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+
+def run(split, args, images):
+    """Один вариант раскладки: прогрев, затем args.requests запросов от args.clients клиентов"""
+    replicas, threads = split
+    pool = DetectorPool(lambda: FruitDetector(args.model, tile_mode='off'),
+                        replicas=replicas, threads=threads, pin_cores=args.pin_cores)
+    pool.warmup()
+
+    def call(_, index):
+        with pool.checkout() as detector:
+            detector.detect_image(images[index % len(images)], annotate=False)
+
+    result = {'replicas': replicas, 'threads_per_replica': threads, 'pin_cores': args.pin_cores}
+    result.update(measure(call, args))
+    return result
+
+
+def run_upload(split, args):
+    """Один вариант через POST /upload в отдельном процессе с настройками FRUIT_*"""
+    replicas, threads = split
+    model = os.path.abspath(args.model) if os.path.exists(args.model) else args.model
+    env = dict(os.environ,
+               FRUIT_MODEL=model,
+               FRUIT_DETECTOR_REPLICAS=str(replicas),
+               FRUIT_DETECTOR_THREADS=str(threads),
+               FRUIT_DETECTOR_PIN_CORES='1' if args.pin_cores else '0',
+               FRUIT_TILE_MODE='off',
+               # Каждый запрос проходит через модель синхронно
+               FRUIT_RESULT_CACHE='0',
+               FRUIT_ASYNC_WORKERS='0')
+    command = [sys.executable, os.path.abspath(__file__), '--upload-worker',
+               '--clients', str(args.clients), '--requests', str(args.requests),
+               '--width', str(args.width), '--height', str(args.height)]
+
+    # База и загрузки приложения создаются во временном каталоге
+    with tempfile.TemporaryDirectory() as workdir:
+        completed = subprocess.run(command, env=env, cwd=workdir, check=True,
+                                   capture_output=True, text=True)
+    result = {'replicas': replicas, 'threads_per_replica': threads, 'pin_cores': args.pin_cores}
+    result.update(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return result
+
+
+def upload_worker(args, images):
+    """Замер внутри процесса run_upload: клиенты Flask отправляют изображения в /upload"""
+    import cv2
+
+    import app as web_app
+
+    web_app.get_detector_pool().warmup()
+    payloads = [cv2.imencode('.jpg', image)[1].tobytes() for image in images]
+
+    def call(client, index):
+        response = client.post('/upload', data={
+            'file': (io.BytesIO(payloads[index % len(payloads)]), 'bench.jpg'),
+            'annotate': '0'
+        }, content_type='multipart/form-data')
+        if response.status_code != 200:
+            raise RuntimeError(f'/upload returned {response.status_code}')
+
+    result = measure(call, args, make_client=web_app.app.test_client)
+    if web_app.batch_scheduler is not None:
+        result['batch_size'] = web_app.batch_scheduler.stats()['batch_size']
+    result['replica_calls'] = [replica['calls'] for replica in
+                               web_app.get_detector_pool().stats()['replicas']]
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк реплик модели и потоков')
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--splits', nargs='+', type=parse_split,
+                        help='Варианты раскладки вида 4x2 (реплики x потоки)')
+    parser.add_argument('--clients', type=int, default=8,
+                        help='Число параллельных клиентов')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--pin-cores', action='store_true',
+                        help='Привязывать реплики к своим ядрам')
+    parser.add_argument('--mode', choices=('pool', 'upload'), default='pool',
+                        help='pool - вызовы DetectorPool напрямую, upload - через POST /upload')
+    parser.add_argument('--upload-worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    images = [make_image(args.width, args.height, density, seed=seed)
+              for seed, density in enumerate((5, 20, 50, 100))]
+
+    if args.upload_worker:
+        upload_worker(args, images)
+        return
+
+    splits = args.splits or default_splits()
+    if args.mode == 'upload':
+        results = [run_upload(split, args) for split in splits]
+    else:
+        results = [run(split, args, images) for split in splits]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Замер времени запуска приложения: импорт app.py в отдельном процессе,
+этапы из STARTUP_TIMINGS (импорты, база, загрузка модели, прогрев).
+
+Запуск из корня проекта:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --max-seconds 3 --lazy
+
+С --max-seconds скрипт завершается с кодом 1, если медиана общего
+времени запуска превышает порог (для CI)
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, time
+start = time.perf_counter()
+import app
+timings = dict(app.STARTUP_TIMINGS)
+timings['import_app'] = round(time.perf_counter() - start, 4)
+print(json.dumps(timings))
+'''
+
+
+def run_once(env):
+    """Один запуск приложения в новом процессе"""
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк времени запуска')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--lazy', action='store_true',
+                        help='Без предзагрузки модели (FRUIT_MODEL_PRELOAD=0)')
+    parser.add_argument('--max-seconds', type=float, default=None)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.lazy:
+        env['FRUIT_MODEL_PRELOAD'] = '0'
+
+    runs = [run_once(env) for _ in range(args.runs)]
+    stages = sorted({stage for run in runs for stage in run})
+    result = {
+        'runs': args.runs,
+        'preload': not args.lazy,
+        'median_seconds': {stage: round(statistics.median(run.get(stage, 0.0) for run in runs), 4)
+                           for stage in stages}
+    }
+    print(json.dumps(result, indent=2))
+
+    if args.max_seconds is not None and result['median_seconds']['total'] > args.max_seconds:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
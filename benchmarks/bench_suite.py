@@ -0,0 +1,290 @@
+"""
+Офлайн-набор бенчмарков горячих путей: детекция, видео, запросы
+к базе (/statistics, /history) и генерация отчетов.
+
+Данные синтетические и детерминированные (см. synthetic.py), базы
+на 10k/100k/1M строк создаются один раз и переиспользуются из --workdir.
+Результат - JSON; с --baseline метрики сравниваются с прошлым прогоном,
+и при ухудшении больше --tolerance скрипт завершается с кодом 1.
+
+Запуск из корня проекта:
+    python benchmarks/bench_suite.py --output bench.json
+    python benchmarks/bench_suite.py --groups database reports --db-rows 10000 100000 1000000
+    python benchmarks/bench_suite.py --baseline bench.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+os.environ.setdefault('FRUIT_MODEL_PRELOAD', '0')
+# Замеряем запросы к базе, а не кэш ответов
+os.environ.setdefault('FRUIT_RESPONSE_CACHE', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_image, make_video, populate_database
+from timing import percentile
+
+GROUPS = ('detection', 'video', 'database', 'reports')
+
+# Разрешения и плотности синтетических изображений
+RESOLUTIONS = [(640, 480), (1920, 1080), (4000, 3000)]
+DENSITIES = [5, 50, 200]
+
+# Суффиксы метрик, для которых большее значение лучше (остальные - меньше лучше)
+HIGHER_IS_BETTER = ('_per_second', '_fps')
+
+
+def measure(fn, repeat):
+    """Задержки repeat вызовов fn, секунды"""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def peak_memory_mb(fn):
+    """Пиковое выделение памяти Python (tracemalloc) за один вызов fn, MB"""
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / (1024 * 1024), 2)
+
+
+def latency_metrics(latencies):
+    """Сводка по задержкам"""
+    total = sum(latencies)
+    return {
+        'latency_p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'throughput_per_second': round(len(latencies) / total, 2) if total > 0 else 0.0
+    }
+
+
+def bench_detection(args):
+    """Задержка и пропускная способность детекции на синтетических снимках"""
+    from fruit_detector import FruitDetector
+
+    detector = FruitDetector(args.model)
+    detector.warmup()
+
+    cases = []
+    for width, height in RESOLUTIONS:
+        for density in DENSITIES:
+            image = make_image(width, height, density)
+            latencies = measure(lambda: detector.detect_image(image, annotate=False),
+                                args.repeat)
+            case = {'group': 'detection', 'name': f'{width}x{height}/d{density}'}
+            case.update(latency_metrics(latencies))
+            case['peak_memory_mb'] = peak_memory_mb(
+                lambda: detector.detect_image(image, annotate=False))
+            cases.append(case)
+    return cases
+
+
+def bench_video(args):
+    """Кадры в секунду при обработке синтетического видео конвейера"""
+    from fruit_detector import FruitDetector
+
+    detector = FruitDetector(args.model)
+    detector.warmup()
+    video_path = os.path.join(args.workdir, 'conveyor.avi')
+    if not os.path.exists(video_path):
+        make_video(video_path)
+
+    cases = []
+    for frame_interval, track, adaptive in [(1, False, False), (5, False, False),
+                                            (1, True, False), (1, True, True)]:
+        result = detector.process_video(video_path, frame_interval=frame_interval, track=track,
+                                        adaptive=adaptive)
+        name = 'adaptive' if adaptive else f'interval{frame_interval}'
+        cases.append({
+            'group': 'video',
+            'name': name + ('/track' if track else ''),
+            'frames_read': result['frames_read'],
+            'frames_processed': result['frames_processed'],
+            'frames_skipped': result['frames_skipped'],
+            'video_fps': round(result['fps'], 2),
+            'processing_seconds': round(result['processing_time'], 3)
+        })
+    return cases
+
+
+def bench_database(args):
+    """Задержка /statistics и /history на базах разного размера"""
+    import app as web_app
+    from database import DatabaseManager
+
+    client = web_app.app.test_client()
+    cases = []
+    for rows in args.db_rows:
+        path = os.path.join(args.workdir, f'requests_{rows}.db')
+        if os.path.exists(path):
+            db = DatabaseManager(path)
+        else:
+            start = time.perf_counter()
+            db = populate_database(path, rows)
+            print(f'populated {rows} rows in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+        web_app.db_manager = db
+
+        middle_id = rows // 2
+        endpoints = {
+            'statistics': '/statistics',
+            'history/first_page': '/history?limit=50',
+            'history/deep_page': f'/history?limit=50&before_id={middle_id}',
+            'history/fruit_filter': '/history?limit=50&fruit=banana',
+            'history/date_range': '/history?limit=50&date_from=2024-06-01&date_to=2024-06-30'
+        }
+        for name, url in endpoints.items():
+            latencies = measure(lambda: client.get(url), args.repeat)
+            case = {'group': 'database', 'name': f'{rows}/{name}'}
+            case.update(latency_metrics(latencies))
+            cases.append(case)
+
+        db.close()
+    return cases
+
+
+def bench_reports(args):
+    """Время и пиковая память генерации отчетов"""
+    from database import DatabaseManager
+    from report_generator import ReportGenerator
+
+    rows = min(args.db_rows)
+    path = os.path.join(args.workdir, f'requests_{rows}.db')
+    db = DatabaseManager(path) if os.path.exists(path) else populate_database(path, rows)
+    report_gen = ReportGenerator(os.path.join(args.workdir, 'reports'))
+
+    latest = db.get_latest_request()
+    statistics = {'total_fruits': latest['total_fruits'], 'fruit_counts': latest['fruit_counts']}
+
+    def history(report_format):
+        return lambda: report_gen.generate_history_report(db.iter_requests(), report_format)
+
+    def stream(report_format):
+        return lambda: sum(len(chunk) for chunk in
+                           report_gen.stream_history_report(db.iter_requests(), report_format))
+
+    jobs = {
+        'pdf': lambda: report_gen.generate_pdf_report(statistics, latest),
+        'excel': lambda: report_gen.generate_excel_report(statistics, latest),
+        f'history_xlsx/{rows}': history('xlsx'),
+        f'history_csv/{rows}': history('csv'),
+        f'history_stream_csv/{rows}': stream('csv')
+    }
+
+    cases = []
+    for name, fn in jobs.items():
+        latencies = measure(fn, max(1, args.repeat // 5))
+        cases.append({
+            'group': 'reports',
+            'name': name,
+            'seconds': round(percentile(latencies, 0.5), 4),
+            'peak_memory_mb': peak_memory_mb(fn)
+        })
+
+    db.close()
+    return cases
+
+
+def compare(results, baseline, tolerance):
+    """Сравнение с базовым прогоном: список ухудшений больше tolerance"""
+    previous = {(case['group'], case['name']): case for case in baseline.get('results', [])}
+    regressions = []
+    for case in results:
+        old = previous.get((case['group'], case['name']))
+        if old is None:
+            continue
+        for metric, value in case.items():
+            old_value = old.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old_value, (int, float)) \
+                    or metric.startswith('frames_') or old_value <= 0:
+                continue
+            if metric.endswith(HIGHER_IS_BETTER):
+                change = (old_value - value) / old_value
+            else:
+                change = (value - old_value) / old_value
+            if change > tolerance:
+                regressions.append({
+                    'group': case['group'],
+                    'name': case['name'],
+                    'metric': metric,
+                    'baseline': old_value,
+                    'value': value,
+                    'change': round(change, 4)
+                })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Набор бенчмарков горячих путей')
+    parser.add_argument('--groups', nargs='+', choices=GROUPS, default=list(GROUPS))
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--db-rows', nargs='+', type=int, default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'fruit_bench'))
+    parser.add_argument('--output', help='Файл для результатов (иначе - stdout)')
+    parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Допустимое относительное ухудшение метрики')
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+
+    benches = {
+        'detection': bench_detection,
+        'video': bench_video,
+        'database': bench_database,
+        'reports': bench_reports
+    }
+    results = []
+    skipped = {}
+    for group in args.groups:
+        try:
+            results.extend(benches[group](args))
+        except ImportError as e:
+            # Например, не установлен ultralytics: группа пропускается, а не падает весь прогон
+            skipped[group] = str(e)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'groups': args.groups,
+            'repeat': args.repeat
+        },
+        'skipped': skipped,
+        'results': results
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        report['regressions'] = regressions
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Синтетические данные для бенчмарков: изображения с "фруктами"
+заданной плотности, видео конвейера и заполненные базы данных.
+Все генераторы детерминированы (seed), поэтому прогоны воспроизводимы
+"""
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+
+FRUITS = ['apple', 'orange', 'banana', 'carrot', 'broccoli']
+
+# Цвета "фруктов" (BGR)
+FRUIT_COLORS = [(40, 40, 200), (20, 140, 250), (60, 220, 240), (30, 110, 230), (60, 160, 40)]
+
+
+def make_image(width, height, density, seed=0):
+    """Изображение (BGR) с density круглыми объектами на фоне ящика"""
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), (90, 120, 150), dtype=np.uint8)
+    image += rng.integers(0, 20, size=image.shape, dtype=np.uint8)
+
+    radius_max = max(8, min(width, height) // 12)
+    for _ in range(density):
+        radius = int(rng.integers(max(4, radius_max // 3), radius_max))
+        center = (int(rng.integers(radius, width - radius)),
+                  int(rng.integers(radius, height - radius)))
+        color = FRUIT_COLORS[int(rng.integers(len(FRUIT_COLORS)))]
+        cv2.circle(image, center, radius, color, -1)
+    return image
+
+
+def make_video(path, width=640, height=480, frames=300, fps=30, fruits=10, seed=0):
+    """Видео конвейера: объекты движутся слева направо с постоянной скоростью"""
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+
+    # Стартовые позиции разнесены по всей длине ленты, объекты появляются по очереди
+    xs = rng.uniform(-width * 2, width, size=fruits)
+    ys = rng.uniform(height * 0.2, height * 0.8, size=fruits)
+    radii = rng.integers(15, 35, size=fruits)
+    colors = [FRUIT_COLORS[i % len(FRUIT_COLORS)] for i in range(fruits)]
+    speed = width / fps
+
+    for _ in range(frames):
+        frame = np.full((height, width, 3), (70, 70, 70), dtype=np.uint8)
+        for x, y, radius, color in zip(xs, ys, radii, colors):
+            if -radius < x < width + radius:
+                cv2.circle(frame, (int(x), int(y)), int(radius), color, -1)
+        writer.write(frame)
+        xs += speed
+
+    writer.release()
+    return path
+
+
+def populate_database(path, rows, seed=0, days=365, chunk_size=10000):
+    """
+    Заполнение базы rows синтетическими запросами одной массовой вставкой
+    (в обход save_request), затем пересчет агрегатов
+    """
+    rng = random.Random(seed)
+    db = DatabaseManager(path)
+    conn = db.pool.acquire()
+    cursor = conn.cursor()
+
+    start = datetime(2024, 1, 1)
+    step = timedelta(days=days) / max(rows, 1)
+    for offset in range(0, rows, chunk_size):
+        requests, counts = [], []
+        for request_id in range(offset + 1, min(rows, offset + chunk_size) + 1):
+            fruit_counts = {fruit: rng.randint(1, 20)
+                            for fruit in rng.sample(FRUITS, rng.randint(1, 3))}
+            timestamp = (start + step * request_id).strftime('%Y-%m-%d %H:%M:%S')
+            requests.append((request_id, timestamp, f'bench_{request_id}.jpg',
+                             sum(fruit_counts.values()), json.dumps(fruit_counts),
+                             f'static/results/result_bench_{request_id}.jpg',
+                             rng.uniform(0.02, 0.2)))
+            counts.extend((request_id, fruit, count) for fruit, count in fruit_counts.items())
+
+        cursor.executemany('''
+            INSERT INTO requests (id, timestamp, filename, total_fruits, fruit_counts,
+                                  result_image, processing_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', requests)
+        cursor.executemany('''
+            INSERT INTO request_fruit_counts (request_id, fruit, count)
+            VALUES (?, ?, ?)
+        ''', counts)
+        conn.commit()
+
+    db.pool.release(conn)
+    db.rebuild_statistics()
+    return db
@@ -0,0 +1,9 @@
+"""Общие функции обработки замеров для бенчмарков"""
+
+
+def percentile(values, q):
+    """Перцентиль по отсортированной выборке"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
@@ -0,0 +1,237 @@
+"""
+Пакетная обработка множества изображений: загрузка нескольких файлов
+или архива (ZIP/TAR) и обработка каталога из командной строки.
+
+Запуск из корня проекта:
+    python bulk.py path/to/images --annotate > results.ndjson
+"""
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+
+from utils import allowed_file, make_upload_filename
+
+# Расширения архивов, которые распаковываются при пакетной загрузке
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz')
+
+
+def is_archive(filename):
+    """Является ли файл поддерживаемым архивом"""
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def spool(fileobj, max_memory=8 * 1024 * 1024):
+    """
+    Копия загруженного файла, которая живет дольше запроса (для потокового
+    ответа): небольшие файлы остаются в памяти, большие уходят во временный файл
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    shutil.copyfileobj(fileobj, spooled)
+    spooled.seek(0)
+    return spooled
+
+
+class ArchiveLimitError(ValueError):
+    """Суммарный размер распакованных файлов архива превышает лимит"""
+
+
+def read_limited(fileobj, limit=0):
+    """
+    Чтение не больше limit байт (0 - без ограничения).
+    None, если данных больше limit: лишнее не читается
+    """
+    if not limit:
+        return fileobj.read()
+    data = fileobj.read(limit + 1)
+    return data if len(data) <= limit else None
+
+
+def iter_archive(fileobj, filename, max_entry_bytes=0, max_total_bytes=0):
+    """
+    Изображения из архива: пары (имя, байты), по одному файлу за раз.
+    Файл больше max_entry_bytes не распаковывается и выдается с байтами None;
+    если распакованные файлы в сумме больше max_total_bytes, чтение прерывается
+    ArchiveLimitError (защита от zip-бомб). Размеры из заголовков архива
+    не доверяются: лимиты проверяются по фактически прочитанным байтам
+    """
+    total = 0
+
+    def read_entry(name, size, open_entry):
+        nonlocal total
+        if max_entry_bytes and size > max_entry_bytes:
+            return None
+        with open_entry() as entry:
+            data = read_limited(entry, max_entry_bytes)
+        if data is not None:
+            total += len(data)
+            if max_total_bytes and total > max_total_bytes:
+                raise ArchiveLimitError(f'Archive {filename} exceeds the unpacked size limit')
+        return data
+
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and allowed_file(info.filename):
+                    yield info.filename, read_entry(info.filename, info.file_size,
+                                                    lambda: archive.open(info))
+        return
+
+    # Потоковое чтение tar (в том числе сжатого) без перемотки
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile() and allowed_file(member.name):
+                yield member.name, read_entry(member.name, member.size,
+                                              lambda: archive.extractfile(member))
+
+
+def iter_directory(path, recursive=True):
+    """Изображения из каталога: пары (путь, байты) в порядке имен"""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if allowed_file(name):
+                filepath = os.path.join(root, name)
+                with open(filepath, 'rb') as f:
+                    yield filepath, f.read()
+        if not recursive:
+            break
+
+
+def detect_stream(detector, images, upload_folder, batch_size=8, annotate=True,
+                  checkout=None):
+    """
+    Детекция потока изображений батчами по batch_size: декодированными
+    в памяти одновременно держатся только изображения текущего батча.
+    images - пары (имя, байты; None - файл отклонен). Выдает (имя,
+    статистика или None, время обработки) по мере готовности каждого батча.
+    checkout() - контекстный менеджер, который выдает детектор на время
+    инференса батча (DetectorPool.checkout); без него батч идет в detector
+    """
+    batch = []
+
+    def flush(batch):
+        start_time = time.time()
+        names, arrays, paths, failed = [], [], [], []
+        for index, name, data in batch:
+            if data is None:
+                failed.append(name)
+                continue
+            try:
+                arrays.append(detector.decode_image(data))
+            except Exception:
+                # Ошибка попадает в результат как статистика None
+                failed.append(name)
+                continue
+            names.append(name)
+            # Номер в имени: одинаковые имена из разных каталогов архива не затирают результаты
+            paths.append(os.path.join(upload_folder,
+                                      make_upload_filename(f'{index}_{os.path.basename(name)}')))
+
+        statistics = []
+        if arrays and checkout is not None:
+            with checkout() as replica:
+                statistics = replica.detect_batch(arrays, paths, annotate)
+        elif arrays:
+            statistics = detector.detect_batch(arrays, paths, annotate)
+        processing_time = time.time() - start_time
+
+        results = [(name, None, processing_time) for name in failed]
+        results.extend((name, stats, processing_time)
+                       for name, stats in zip(names, statistics))
+        return results
+
+    for index, (name, data) in enumerate(images):
+        batch.append((index, name, data))
+        if len(batch) >= batch_size:
+            yield from flush(batch)
+            batch = []
+
+    if batch:
+        yield from flush(batch)
+
+
+class BulkSummary:
+    """Суммарные счетчики пакетной обработки"""
+
+    def __init__(self):
+        self.images = 0
+        self.failed = 0
+        self.total_fruits = 0
+        self.fruit_counts = {}
+        self.start_time = time.time()
+
+    def add(self, statistics):
+        """Учет результата одного изображения (None - ошибка)"""
+        self.images += 1
+        if not statistics:
+            self.failed += 1
+            return
+        self.total_fruits += statistics['total_fruits']
+        for fruit, count in statistics['fruit_counts'].items():
+            self.fruit_counts[fruit] = self.fruit_counts.get(fruit, 0) + count
+
+    def to_dict(self):
+        """Итог в виде словаря для JSON"""
+        return {
+            'type': 'summary',
+            'images': self.images,
+            'failed': self.failed,
+            'total_fruits': self.total_fruits,
+            'fruit_counts': self.fruit_counts,
+            'processing_time': round(time.time() - self.start_time, 3)
+        }
+
+
+def main():
+    import argparse
+
+    from database import DatabaseManager
+    from fruit_detector import FruitDetector
+
+    parser = argparse.ArgumentParser(description='Подсчет фруктов на всех изображениях каталога')
+    parser.add_argument('path', help='Каталог с изображениями')
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--db', default='fruits.db', help='Путь к базе данных')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--annotate', action='store_true',
+                        help='Сохранять аннотированные изображения в static/results')
+    parser.add_argument('--no-recursive', action='store_true')
+    args = parser.parse_args()
+
+    detector = FruitDetector(args.model)
+    db_manager = DatabaseManager(args.db)
+    os.makedirs(os.path.join('static', 'results'), exist_ok=True)
+
+    summary = BulkSummary()
+    saved = []
+    images = iter_directory(args.path, recursive=not args.no_recursive)
+    for name, statistics, processing_time in detect_stream(detector, images, args.path,
+                                                           args.batch_size, args.annotate):
+        summary.add(statistics)
+        if not statistics:
+            print(json.dumps({'type': 'error', 'filename': name}), flush=True)
+            continue
+        saved.append((os.path.basename(name), statistics, processing_time))
+        print(json.dumps({
+            'type': 'result',
+            'filename': name,
+            'total': statistics['total_fruits'],
+            'by_fruit': statistics['fruit_counts'],
+            'result_image': statistics['result_image']
+        }, ensure_ascii=False), flush=True)
+
+    # Все строки каталога сохраняются одной транзакцией
+    request_ids = db_manager.save_requests(saved)
+    db_manager.close()
+
+    result = summary.to_dict()
+    result['request_ids'] = request_ids
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import os
+
+
+def _env_bool(name, default):
+    """Чтение булевого параметра из переменной окружения"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_int(name, default):
+    """Чтение целочисленного параметра из переменной окружения"""
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_float(name, default):
+    """Чтение вещественного параметра из переменной окружения"""
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+# Веса модели и движок инференса: torch, onnx, onnx-int8, openvino, openvino-int8
+MODEL_PATH = os.environ.get('FRUIT_MODEL', 'yolov8n.pt')
+INFERENCE_BACKEND = os.environ.get('FRUIT_BACKEND', 'torch')
+# YAML набора изображений для калибровки openvino-int8 (нужен пакет nncf);
+# пусто - пример COCO, который ultralytics скачивает при экспорте
+INT8_CALIBRATION_DATA = os.environ.get('FRUIT_INT8_CALIBRATION_DATA') or None
+
+# Динамический микробатчинг инференса:
+# запросы собираются в батч, пока он не заполнится или не истечет окно ожидания
+BATCHING_ENABLED = _env_bool('FRUIT_BATCHING', True)
+BATCH_MAX_SIZE = _env_int('FRUIT_BATCH_MAX_SIZE', 8)
+BATCH_MAX_WAIT_MS = _env_float('FRUIT_BATCH_MAX_WAIT_MS', 10)
+
+# Асинхронная обработка загрузок в пуле процессов (0 - выключено)
+ASYNC_WORKERS = _env_int('FRUIT_ASYNC_WORKERS', 2)
+# Максимум незавершенных задач, сверх него /upload отвечает 429
+ASYNC_MAX_PENDING = _env_int('FRUIT_ASYNC_MAX_PENDING', 32)
+# Веб-интерфейс отправляет загрузки в пул процессов (async=1); по умолчанию
+# синхронно - через микробатчинг и реплики модели без записи оригинала на диск
+UI_ASYNC_UPLOADS = _env_bool('FRUIT_UI_ASYNC_UPLOADS', False)
+
+# Кэш результатов по хэшу изображения
+RESULT_CACHE_ENABLED = _env_bool('FRUIT_RESULT_CACHE', True)
+RESULT_CACHE_MAX_ENTRIES = _env_int('FRUIT_RESULT_CACHE_MAX_ENTRIES', 1024)
+RESULT_CACHE_TTL = _env_int('FRUIT_RESULT_CACHE_TTL', 3600)
+# Путь к SQLite для постоянного уровня кэша (пусто - только память)
+RESULT_CACHE_DB = os.environ.get('FRUIT_RESULT_CACHE_DB', '')
+
+# Сохранять отдельные детекции (bbox, уверенность) в таблицу detections
+STORE_DETECTIONS = _env_bool('FRUIT_STORE_DETECTIONS', False)
+
+# Групповая запись в SQLite: save_request из разных потоков коммитятся вместе
+# (интервал - сколько ждать новых записей перед коммитом; 0 - только уже накопленные)
+DB_BATCH_WRITES = _env_bool('FRUIT_DB_BATCH_WRITES', True)
+DB_BATCH_INTERVAL_MS = _env_float('FRUIT_DB_BATCH_INTERVAL_MS', 0)
+
+# Фоновая генерация отчетов: число потоков и сколько ждать готовности в запросе
+REPORT_WORKERS = _env_int('FRUIT_REPORT_WORKERS', 2)
+REPORT_WAIT_SECONDS = _env_float('FRUIT_REPORT_WAIT_SECONDS', 10)
+
+# Плиточная детекция больших снимков: 'auto' (от TILE_MIN_SIDE пикселей), 'on' или 'off'
+TILE_MODE = os.environ.get('FRUIT_TILE_MODE', 'auto')
+TILE_SIZE = _env_int('FRUIT_TILE_SIZE', 640)
+# Доля перекрытия соседних плиток
+TILE_OVERLAP = _env_float('FRUIT_TILE_OVERLAP', 0.2)
+TILE_MIN_SIDE = _env_int('FRUIT_TILE_MIN_SIDE', 1920)
+# Сколько плиток передается в модель за один вызов
+TILE_BATCH_SIZE = _env_int('FRUIT_TILE_BATCH_SIZE', 8)
+
+# Загрузка модели при старте (иначе - при первой детекции) и прогревочный инференс
+MODEL_PRELOAD = _env_bool('FRUIT_MODEL_PRELOAD', True)
+MODEL_WARMUP = _env_bool('FRUIT_MODEL_WARMUP', True)
+
+# Замер длительности этапов обработки (GET /metrics, таблица request_stage_timings)
+TRACING_ENABLED = _env_bool('FRUIT_TRACING', True)
+
+# Хранение загрузок, результатов и отчетов: срок, квота на суммарный размер
+# (0 - без квоты) и период фоновой очистки в секундах
+RETENTION_MAX_AGE_HOURS = _env_float('FRUIT_RETENTION_MAX_AGE_HOURS', 24)
+RETENTION_MAX_BYTES = _env_int('FRUIT_RETENTION_MAX_BYTES', 0)
+RETENTION_INTERVAL = _env_float('FRUIT_RETENTION_INTERVAL', 60)
+
+# Сохранять ли оригиналы загрузок в static/uploads (детекция идет из памяти;
+# для асинхронных задач файл сохраняется всегда)
+PERSIST_UPLOADS = _env_bool('FRUIT_PERSIST_UPLOADS', False)
+
+# Максимальный размер пакетной загрузки (несколько файлов или архив)
+BULK_MAX_CONTENT_LENGTH = _env_int('FRUIT_BULK_MAX_CONTENT_LENGTH', 512 * 1024 * 1024)
+
+# Видеопотоки (камеры, RTSP): максимум одновременно работающих потоков
+# и микробатч общего планировщика инференса для кадров всех потоков
+STREAMS_MAX = _env_int('FRUIT_STREAMS_MAX', 8)
+STREAMS_BATCH_SIZE = _env_int('FRUIT_STREAMS_BATCH_SIZE', 8)
+STREAMS_BATCH_WAIT_MS = _env_float('FRUIT_STREAMS_BATCH_WAIT_MS', 20)
+# Разрешенные источники видеопотоков через запятую: номера камер, файлы
+# или каталоги и URL потоков (rtsp://host[:port]); пусто - потоки запрещены
+STREAM_SOURCES = [source.strip() for source in
+                  os.environ.get('FRUIT_STREAM_SOURCES', '').split(',') if source.strip()]
+
+# Ленивая отрисовка результатов: при загрузке сохраняются оригинал и детекции,
+# аннотированное изображение рисуется при первом запросе GET /results/<id>
+LAZY_RESULTS = _env_bool('FRUIT_LAZY_RESULTS', True)
+# Большая сторона миниатюры для таблицы истории, пиксели
+RESULT_THUMB_SIZE = _env_int('FRUIT_RESULT_THUMB_SIZE', 320)
+# Формат отрисованных изображений: 'jpeg', 'webp' или 'auto' (WebP, если его принимает браузер)
+RESULT_IMAGE_FORMAT = os.environ.get('FRUIT_RESULT_IMAGE_FORMAT', 'auto')
+RESULT_IMAGE_QUALITY = _env_int('FRUIT_RESULT_IMAGE_QUALITY', 85)
+# Cache-Control: max-age для отрисованных изображений, секунды
+RESULT_IMAGE_MAX_AGE = _env_int('FRUIT_RESULT_IMAGE_MAX_AGE', 86400)
+
+# Реплики модели для параллельных вызовов: число копий, потоков intra-op
+# на реплику (0 - поровну делим ядра) и привязка реплики к своим ядрам (Linux)
+DETECTOR_REPLICAS = _env_int('FRUIT_DETECTOR_REPLICAS', 1)
+DETECTOR_THREADS = _env_int('FRUIT_DETECTOR_THREADS', 0)
+DETECTOR_PIN_CORES = _env_bool('FRUIT_DETECTOR_PIN_CORES', False)
+
+# Кэш ответов /, /history и /statistics до следующего сохраненного запроса
+# (ETag/Last-Modified, 304 Not Modified, gzip от GZIP_MIN_BYTES байт)
+RESPONSE_CACHE_ENABLED = _env_bool('FRUIT_RESPONSE_CACHE', True)
+RESPONSE_CACHE_MAX_ENTRIES = _env_int('FRUIT_RESPONSE_CACHE_MAX_ENTRIES', 256)
+RESPONSE_GZIP_MIN_BYTES = _env_int('FRUIT_RESPONSE_GZIP_MIN_BYTES', 500)
+
+# Адаптивный выбор кадров видео по движению: шаг между кадрами для модели
+# от MIN до MAX кадров и порог движения - доля изменившихся пикселей миниатюры
+VIDEO_MIN_INTERVAL = _env_int('FRUIT_VIDEO_MIN_INTERVAL', 1)
+VIDEO_MAX_INTERVAL = _env_int('FRUIT_VIDEO_MAX_INTERVAL', 30)
+VIDEO_MOTION_THRESHOLD = _env_float('FRUIT_VIDEO_MOTION_THRESHOLD', 0.002)
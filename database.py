@@ -3,14 +3,36 @@ import json
 from datetime import datetime
 import os
 
+from db_pool import ConnectionPool, BatchWriter
+from metrics import tracer
+
+# Версия схемы (PRAGMA user_version), по ней применяются миграции
+SCHEMA_VERSION = 3
+
+# Поля запроса, которые можно выбрать в get_requests_page
+REQUEST_FIELDS = ('id', 'timestamp', 'filename', 'total_fruits',
+                  'fruit_counts', 'result_image', 'processing_time')
+
 class DatabaseManager:
-    def __init__(self, db_path='fruits.db'):
+    def __init__(self, db_path='fruits.db', store_detections=False,
+                 batch_writes=False, batch_interval_ms=0, pool_size=8):
         self.db_path = db_path
+        # Сохранять ли отдельные детекции (bbox, уверенность) в таблицу detections
+        self.store_detections = store_detections
+        
+        # Пул соединений в режиме WAL вместо нового соединения на каждый вызов
+        self.pool = ConnectionPool(db_path, max_size=pool_size)
         self.init_database()
+        
+        # Групповая запись: save_request из разных потоков коммитятся одной транзакцией
+        self.batch_writer = None
+        if batch_writes:
+            self.batch_writer = BatchWriter(self.pool, self._insert_request,
+                                            interval_ms=batch_interval_ms)
     
     def init_database(self):
         """Инициализация базы данных"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.pool.acquire()
         cursor = conn.cursor()
         
         # Таблица для истории запросов
@@ -26,7 +48,7 @@ class DatabaseManager:
             )
         ''')
         
-        # Таблица для статистики
+        # Таблица для статистики (агрегаты по дням, обновляются при каждом запросе)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS statistics (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -36,70 +58,666 @@ class DatabaseManager:
                 most_common_fruit TEXT
             )
         ''')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_statistics_date
+            ON statistics (date)
+        ''')
+        
+        # Накопительные итоги по каждому фрукту
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fruit_statistics (
+                fruit TEXT PRIMARY KEY,
+                total_count INTEGER
+            )
+        ''')
+        
+        # Итоги по фруктам за каждый день
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_fruit_statistics (
+                date DATE,
+                fruit TEXT,
+                total_count INTEGER,
+                PRIMARY KEY (date, fruit)
+            )
+        ''')
+        
+        # Количество каждого фрукта в запросе (нормализованная замена JSON в requests)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS request_fruit_counts (
+                request_id INTEGER REFERENCES requests (id) ON DELETE CASCADE,
+                fruit TEXT,
+                count INTEGER,
+                PRIMARY KEY (request_id, fruit)
+            )
+        ''')
+        
+        # Отдельные детекции запроса (заполняется при store_detections=True)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS detections (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                request_id INTEGER REFERENCES requests (id) ON DELETE CASCADE,
+                fruit TEXT,
+                confidence REAL,
+                x1 REAL,
+                y1 REAL,
+                x2 REAL,
+                y2 REAL,
+                area REAL
+            )
+        ''')
+        
+        # Длительности этапов обработки запроса (декодирование, инференс и т.д.)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS request_stage_timings (
+                request_id INTEGER REFERENCES requests (id) ON DELETE CASCADE,
+                stage TEXT,
+                seconds REAL,
+                PRIMARY KEY (request_id, stage)
+            )
+        ''')
+        
+        # Асинхронные задачи: состояние доступно любому процессу приложения,
+        # а не только тому, который принял загрузку
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT,
+                created REAL,
+                finished REAL,
+                statistics TEXT,
+                processing_time REAL,
+                error TEXT,
+                request_id INTEGER
+            )
+        ''')
+        
+        # Индексы для выборок по времени, дате и фрукту
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_requests_timestamp
+            ON requests (timestamp)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_requests_date
+            ON requests (DATE(timestamp))
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_request_fruit_counts_fruit
+            ON request_fruit_counts (fruit, request_id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_detections_request
+            ON detections (request_id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_detections_fruit
+            ON detections (fruit)
+        ''')
+        
+        self._migrate(cursor)
         
         conn.commit()
-        conn.close()
+        self.pool.release(conn)
     
-    def save_request(self, filename, statistics, processing_time):
-        """Сохранение запроса в базу данных"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _migrate(self, cursor):
+        """Миграция данных существующей базы до SCHEMA_VERSION"""
+        cursor.execute('PRAGMA user_version')
+        version = cursor.fetchone()[0]
+        
+        if version < 1:
+            # Переносим счетчики фруктов из JSON в нормализованную таблицу
+            cursor.execute('''
+                INSERT OR IGNORE INTO request_fruit_counts (request_id, fruit, count)
+                SELECT r.id, j.key, j.value
+                FROM requests r, json_each(r.fruit_counts) j
+            ''')
+        
+        # Версия 2 добавляет только таблицу request_stage_timings (создается выше),
+        # для старых запросов замеров нет
+        
+        if version < 3:
+            # Агрегаты обновляются только при сохранении новых запросов:
+            # для уже накопленной истории пересчитываем их один раз
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM requests)')
+            if cursor.fetchone()[0]:
+                self._rebuild_statistics(cursor)
+        
+        if version < SCHEMA_VERSION:
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    
+    def save_request(self, filename, statistics, processing_time, stage_timings=None):
+        """
+        Сохранение запроса в базу данных.
+        stage_timings - длительности этапов обработки {этап: секунды}
+        """
+        with tracer.stage('db_write'):
+            if self.batch_writer is not None:
+                # Ждем коммита группы, в которую попала запись
+                return self.batch_writer.submit(filename, statistics, processing_time,
+                                                stage_timings).result()
+            
+            conn = self.pool.acquire()
+            try:
+                cursor = conn.cursor()
+                
+                request_id = self._insert_request(cursor, filename, statistics, processing_time,
+                                                  stage_timings)
+                
+                conn.commit()
+            finally:
+                self.pool.release(conn)
+            return request_id
+    
+    def save_requests(self, items):
+        """
+        Сохранение пачки запросов одной транзакцией.
+        items - кортежи (filename, statistics, processing_time[, stage_timings]);
+        возвращает список ID в том же порядке
+        """
+        if not items:
+            return []
         
+        with tracer.stage('db_write'):
+            conn = self.pool.acquire()
+            cursor = conn.cursor()
+            
+            try:
+                request_ids = [self._insert_request(cursor, *item) for item in items]
+                conn.commit()
+            finally:
+                self.pool.release(conn)
+            return request_ids
+    
+    def _insert_request(self, cursor, filename, statistics, processing_time,
+                        stage_timings=None):
+        """Вставка запроса и обновление агрегатов (без коммита)"""
         fruit_counts_json = json.dumps(statistics['fruit_counts'])
         
+        # Время в формате CURRENT_TIMESTAMP (UTC), чтобы дата агрегатов совпадала с запросом
+        timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        
         cursor.execute('''
-            INSERT INTO requests (filename, total_fruits, fruit_counts, 
+            INSERT INTO requests (timestamp, filename, total_fruits, fruit_counts,
                                 result_image, processing_time)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (filename, statistics['total_fruits'], 
-              fruit_counts_json, statistics['result_image'], 
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (timestamp, filename, statistics['total_fruits'],
+              fruit_counts_json, statistics['result_image'],
               processing_time))
+        request_id = cursor.lastrowid
         
-        conn.commit()
-        conn.close()
+        self._save_fruit_counts(cursor, request_id, statistics)
+        
+        if stage_timings:
+            cursor.executemany('''
+                INSERT INTO request_stage_timings (request_id, stage, seconds)
+                VALUES (?, ?, ?)
+            ''', [(request_id, stage, seconds) for stage, seconds in stage_timings.items()])
+        
+        # Обновляем агрегаты в той же транзакции
+        self._update_statistics(cursor, timestamp[:10], statistics)
+        
+        return request_id
+    
+    def _save_fruit_counts(self, cursor, request_id, statistics):
+        """Сохранение счетчиков и (опционально) детекций запроса"""
+        cursor.executemany('''
+            INSERT INTO request_fruit_counts (request_id, fruit, count)
+            VALUES (?, ?, ?)
+        ''', [(request_id, fruit, count)
+              for fruit, count in statistics['fruit_counts'].items()])
+        
+        detections = statistics.get('detections')
+        if self.store_detections and detections:
+            cursor.executemany('''
+                INSERT INTO detections (request_id, fruit, confidence,
+                                        x1, y1, x2, y2, area)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(request_id, fruit, confidence, *bbox, area)
+                  for fruit, confidence, bbox, area in zip(detections['fruit'],
+                                                           detections['confidence'],
+                                                           detections['bbox'],
+                                                           detections['area'])])
+    
+    def _update_statistics(self, cursor, date, statistics):
+        """Инкрементальное обновление агрегатов по одному запросу"""
+        cursor.execute('''
+            INSERT INTO statistics (date, total_requests, total_fruits_detected)
+            VALUES (?, 1, ?)
+            ON CONFLICT (date) DO UPDATE SET
+                total_requests = total_requests + 1,
+                total_fruits_detected = total_fruits_detected + excluded.total_fruits_detected
+        ''', (date, statistics['total_fruits']))
+        
+        fruit_counts = list(statistics['fruit_counts'].items())
+        if not fruit_counts:
+            return
+        
+        cursor.executemany('''
+            INSERT INTO fruit_statistics (fruit, total_count)
+            VALUES (?, ?)
+            ON CONFLICT (fruit) DO UPDATE SET
+                total_count = total_count + excluded.total_count
+        ''', fruit_counts)
+        
+        cursor.executemany('''
+            INSERT INTO daily_fruit_statistics (date, fruit, total_count)
+            VALUES (?, ?, ?)
+            ON CONFLICT (date, fruit) DO UPDATE SET
+                total_count = total_count + excluded.total_count
+        ''', [(date, fruit, count) for fruit, count in fruit_counts])
+        
+        self._update_most_common(cursor, date)
+    
+    def _update_most_common(self, cursor, date=None):
+        """Пересчет самого частого фрукта за день (или за все дни)"""
+        query = '''
+            UPDATE statistics SET most_common_fruit = (
+                SELECT fruit FROM daily_fruit_statistics d
+                WHERE d.date = statistics.date
+                ORDER BY total_count DESC
+                LIMIT 1
+            )
+        '''
+        if date is None:
+            cursor.execute(query)
+        else:
+            cursor.execute(query + ' WHERE date = ?', (date,))
+    
+    def rebuild_statistics(self):
+        """Пересчет всех агрегатов по таблице requests (для существующих баз)"""
+        conn = self.pool.acquire()
+        try:
+            self._rebuild_statistics(conn.cursor())
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+    
+    def _rebuild_statistics(self, cursor):
+        """Пересчет агрегатов по таблице requests (без коммита)"""
+        cursor.execute('DELETE FROM statistics')
+        cursor.execute('DELETE FROM fruit_statistics')
+        cursor.execute('DELETE FROM daily_fruit_statistics')
+        
+        cursor.execute('''
+            INSERT INTO statistics (date, total_requests, total_fruits_detected)
+            SELECT DATE(timestamp), COUNT(*), COALESCE(SUM(total_fruits), 0)
+            FROM requests
+            GROUP BY DATE(timestamp)
+        ''')
+        
+        cursor.execute('''
+            INSERT INTO daily_fruit_statistics (date, fruit, total_count)
+            SELECT DATE(r.timestamp), c.fruit, SUM(c.count)
+            FROM requests r
+            JOIN request_fruit_counts c ON c.request_id = r.id
+            GROUP BY DATE(r.timestamp), c.fruit
+        ''')
+        
+        cursor.execute('''
+            INSERT INTO fruit_statistics (fruit, total_count)
+            SELECT fruit, SUM(total_count)
+            FROM daily_fruit_statistics
+            GROUP BY fruit
+        ''')
+        
+        self._update_most_common(cursor)
     
     def get_all_requests(self):
         """Получение всех запросов"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            
+            cursor.execute('SELECT * FROM requests ORDER BY timestamp DESC')
+            rows = cursor.fetchall()
+            
+            # Конвертируем строки в словари
+            requests = []
+            for row in rows:
+                request = dict(row)
+                request['fruit_counts'] = json.loads(request['fruit_counts'])
+                requests.append(request)
+        finally:
+            self.pool.release(conn)
+        return requests
+    
+    def iter_requests(self, chunk_size=1000):
+        """
+        Потоковое чтение всех запросов (от новых к старым) порциями через курсор:
+        в памяти одновременно находится не больше chunk_size строк
+        """
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute('SELECT * FROM requests ORDER BY id DESC')
+            
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    request = dict(row)
+                    request['fruit_counts'] = json.loads(request['fruit_counts'])
+                    yield request
+        finally:
+            self.pool.release(conn)
+    
+    def get_latest_request(self):
+        """Последний запрос (одна строка) или None"""
+        requests = self.get_recent_requests(1)
+        return requests[0] if requests else None
+    
+    def get_data_version(self):
+        """
+        Версия данных для кэширования ответов: (ID последнего запроса, его время UTC).
+        Меняется при каждом save_request (в любом процессе); (0, None) для пустой базы
+        """
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT id, timestamp FROM requests ORDER BY id DESC LIMIT 1')
+            row = cursor.fetchone()
+        finally:
+            self.pool.release(conn)
+        return (row[0], row[1]) if row else (0, None)
+    
+    def get_request(self, request_id):
+        """Запрос по ID или None"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            
+            cursor.execute('SELECT * FROM requests WHERE id = ?', (request_id,))
+            row = cursor.fetchone()
+        finally:
+            self.pool.release(conn)
+        if row is None:
+            return None
+        request = dict(row)
+        request['fruit_counts'] = json.loads(request['fruit_counts'])
+        return request
+    
+    def get_recent_requests(self, limit=10):
+        """Получение последних запросов (без чтения всей истории)"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            
+            cursor.execute('SELECT * FROM requests ORDER BY id DESC LIMIT ?', (limit,))
+            rows = cursor.fetchall()
+            
+            requests = []
+            for row in rows:
+                request = dict(row)
+                request['fruit_counts'] = json.loads(request['fruit_counts'])
+                requests.append(request)
+        finally:
+            self.pool.release(conn)
+        return requests
+    
+    def get_requests_page(self, before_id=None, limit=50, date_from=None,
+                          date_to=None, fruit=None, fields=None):
+        """
+        Страница истории запросов (keyset пагинация по id, от новых к старым).
+        Фильтры и LIMIT выполняются в SQL. Возвращает (запросы, before_id
+        для следующей страницы или None)
+        """
+        fields = list(fields) if fields else list(REQUEST_FIELDS)
+        unknown = set(fields) - set(REQUEST_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        if 'id' not in fields:
+            fields.insert(0, 'id')
+        
+        conditions, params = self._date_conditions(date_from, date_to)
+        if before_id is not None:
+            conditions.insert(0, 'r.id < ?')
+            params.insert(0, before_id)
         
-        cursor.execute('SELECT * FROM requests ORDER BY timestamp DESC')
-        rows = cursor.fetchall()
+        join = ''
+        order = 'r.id'
+        if fruit:
+            # Фильтр по фрукту через индекс (fruit, request_id): сортировка
+            # по c.request_id идет по индексу без промежуточной сортировки
+            join = 'JOIN request_fruit_counts c ON c.request_id = r.id AND c.fruit = ?'
+            order = 'c.request_id'
+            params.insert(0, fruit)
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        columns = ', '.join(f'r.{field}' for field in fields)
+        
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            
+            # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+            with tracer.stage('db_history'):
+                cursor.execute(f'''
+                    SELECT {columns}
+                    FROM requests r
+                    {join}
+                    {where}
+                    ORDER BY {order} DESC
+                    LIMIT ?
+                ''', params + [limit + 1])
+                rows = cursor.fetchall()
+        finally:
+            self.pool.release(conn)
         
-        # Конвертируем строки в словари
         requests = []
-        for row in rows:
+        for row in rows[:limit]:
             request = dict(row)
-            request['fruit_counts'] = json.loads(request['fruit_counts'])
+            if 'fruit_counts' in request:
+                request['fruit_counts'] = json.loads(request['fruit_counts'])
             requests.append(request)
         
-        conn.close()
-        return requests
+        next_before_id = requests[-1]['id'] if len(rows) > limit else None
+        return requests, next_before_id
+    
+    def get_summary_statistics(self):
+        """Общая статистика из агрегатов (не зависит от размера истории)"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            
+            with tracer.stage('db_statistics'):
+                cursor.execute('''
+                    SELECT COALESCE(SUM(total_requests), 0),
+                           COALESCE(SUM(total_fruits_detected), 0)
+                    FROM statistics
+                ''')
+                total_requests, total_fruits = cursor.fetchone()
+                
+                cursor.execute('''
+                    SELECT fruit, total_count FROM fruit_statistics
+                    ORDER BY total_count DESC
+                ''')
+                fruit_counts = {fruit: count for fruit, count in cursor.fetchall()}
+        finally:
+            self.pool.release(conn)
+        return {
+            'total_requests': total_requests,
+            'total_fruits': total_fruits,
+            'fruit_counts': fruit_counts
+        }
     
     def get_daily_statistics(self):
         """Получение ежедневной статистики"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT date, total_requests, total_fruits_detected, most_common_fruit
+                FROM statistics
+                ORDER BY date DESC
+            ''')
+            
+            stats = cursor.fetchall()
+        finally:
+            self.pool.release(conn)
+        return stats
+    
+    def get_fruit_statistics(self, date_from=None, date_to=None):
+        """Количество каждого фрукта за период (даты включительно, YYYY-MM-DD)"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            
+            conditions, params = self._date_conditions(date_from, date_to)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            
+            cursor.execute(f'''
+                SELECT c.fruit, SUM(c.count)
+                FROM requests r
+                JOIN request_fruit_counts c ON c.request_id = r.id
+                {where}
+                GROUP BY c.fruit
+                ORDER BY SUM(c.count) DESC
+            ''', params)
+            
+            stats = {fruit: count for fruit, count in cursor.fetchall()}
+        finally:
+            self.pool.release(conn)
+        return stats
+    
+    def get_daily_fruit_counts(self, fruit, date_from=None, date_to=None):
+        """Количество одного фрукта по дням за период"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            
+            conditions, params = self._date_conditions(date_from, date_to)
+            conditions.insert(0, 'c.fruit = ?')
+            params.insert(0, fruit)
+            
+            cursor.execute(f'''
+                SELECT DATE(r.timestamp) AS date, SUM(c.count)
+                FROM request_fruit_counts c
+                JOIN requests r ON r.id = c.request_id
+                WHERE {' AND '.join(conditions)}
+                GROUP BY DATE(r.timestamp)
+                ORDER BY date DESC
+            ''', params)
+            
+            stats = cursor.fetchall()
+        finally:
+            self.pool.release(conn)
+        return stats
+    
+    def get_detections(self, request_id):
+        """Сохраненные детекции запроса в колоночном виде"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT fruit, confidence, x1, y1, x2, y2, area
+                FROM detections
+                WHERE request_id = ?
+                ORDER BY id
+            ''', (request_id,))
+            rows = cursor.fetchall()
+        finally:
+            self.pool.release(conn)
+        return {
+            'fruit': [row[0] for row in rows],
+            'confidence': [row[1] for row in rows],
+            'bbox': [list(row[2:6]) for row in rows],
+            'area': [row[6] for row in rows]
+        }
+    
+    def get_stage_timings(self, request_id):
+        """Длительности этапов обработки запроса {этап: секунды}"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT stage, seconds FROM request_stage_timings
+                WHERE request_id = ?
+            ''', (request_id,))
+            timings = dict(cursor.fetchall())
+        finally:
+            self.pool.release(conn)
+        return timings
+    
+    def save_job(self, job):
+        """Сохранение состояния асинхронной задачи (вставка или обновление)"""
+        statistics = json.dumps(job['statistics']) if job['statistics'] is not None else None
         
-        cursor.execute('''
-            SELECT 
-                DATE(timestamp) as date,
-                COUNT(*) as total_requests,
-                SUM(total_fruits) as total_fruits_detected,
-                (
-                    SELECT json_extract(fruit_counts, '$[0]') 
-                    FROM requests r2 
-                    WHERE DATE(r2.timestamp) = DATE(r1.timestamp)
-                    GROUP BY json_extract(fruit_counts, '$[0]')
-                    ORDER BY COUNT(*) DESC 
-                    LIMIT 1
-                ) as most_common_fruit
-            FROM requests r1
-            GROUP BY DATE(timestamp)
-            ORDER BY date DESC
-        ''')
+        conn = self.pool.acquire()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO jobs (id, status, created, finished, statistics,
+                                             processing_time, error, request_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (job['id'], job['status'], job['created'], job['finished'], statistics,
+                  job['processing_time'], job['error'], job['request_id']))
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+    
+    def get_job(self, job_id):
+        """Состояние асинхронной задачи или None"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+            row = cursor.fetchone()
+        finally:
+            self.pool.release(conn)
         
-        stats = cursor.fetchall()
-        conn.close()
-        return stats
+        if row is None:
+            return None
+        job = dict(row)
+        if job['statistics'] is not None:
+            job['statistics'] = json.loads(job['statistics'])
+        return job
+    
+    def delete_finished_jobs(self, before):
+        """Удаление задач, завершенных раньше before (unix time)"""
+        conn = self.pool.acquire()
+        try:
+            conn.execute('DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?', (before,))
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+    
+    @staticmethod
+    def _date_conditions(date_from, date_to):
+        """Условия по диапазону дат, использующие индекс по timestamp"""
+        conditions, params = [], []
+        if date_from:
+            conditions.append('r.timestamp >= ?')
+            params.append(date_from)
+        if date_to:
+            conditions.append("r.timestamp < DATE(?, '+1 day')")
+            params.append(date_to)
+        return conditions, params
+    
+    def close(self):
+        """Остановка групповой записи и закрытие соединений"""
+        if self.batch_writer is not None:
+            self.batch_writer.close()
+        self.pool.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Обслуживание базы данных')
+    parser.add_argument('command', choices=['rebuild-stats'],
+                        help='rebuild-stats - пересчитать агрегаты по истории запросов')
+    parser.add_argument('--db', default='fruits.db', help='Путь к базе данных')
+    args = parser.parse_args()
+    
+    if args.command == 'rebuild-stats':
+        DatabaseManager(args.db).rebuild_statistics()
+        print(f"Агрегаты пересчитаны: {args.db}")
@@ -0,0 +1,201 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+# Настройки соединений SQLite
+PRAGMAS = (
+    # WAL: читатели не блокируются писателем и наоборот
+    'PRAGMA journal_mode = WAL',
+    # В режиме WAL NORMAL безопасен и избавляет от fsync на каждый коммит
+    'PRAGMA synchronous = NORMAL',
+    # Кэш страниц ~64 MB (отрицательное значение - в килобайтах)
+    'PRAGMA cache_size = -65536',
+    # Чтение файла базы через mmap (256 MB)
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA foreign_keys = ON'
+)
+
+
+def _reset_after_fork(ref):
+    """Вызов _reset_after_fork объекта в дочернем процессе, если он еще жив"""
+    instance = ref()
+    if instance is not None:
+        instance._reset_after_fork()
+
+
+class ConnectionPool:
+    """
+    Пул соединений SQLite с настроенными pragma.
+
+    Соединения переиспользуются между запросами (и потоками), поэтому
+    не тратится время на открытие базы, а кэш подготовленных выражений
+    sqlite3 (cached_statements) продолжает работать между вызовами
+    """
+
+    def __init__(self, db_path, max_size=8, timeout=30.0, cached_statements=256):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.max_size = max_size
+        self._idle = queue.LifoQueue(maxsize=max_size)
+
+        # Соединения SQLite нельзя использовать после fork: дочерний
+        # процесс начинает с пустым пулом (соединения родителя не закрываются)
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: _reset_after_fork(ref))
+
+    def _reset_after_fork(self):
+        """Сброс унаследованных от родителя соединений"""
+        self._idle = queue.LifoQueue(maxsize=self.max_size)
+
+    def _connect(self):
+        """Открытие нового соединения"""
+        conn = sqlite3.connect(self.db_path,
+                               timeout=self.timeout,
+                               check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        """Взять соединение из пула (или открыть новое)"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        """Вернуть соединение в пул"""
+        if conn.in_transaction:
+            # Незавершенная транзакция не должна попасть к следующему пользователю
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        """Закрытие всех свободных соединений"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class BatchWriter:
+    """
+    Групповая запись: операции записи из разных потоков собираются
+    в течение interval_ms и выполняются в одной транзакции.
+
+    write_fn(cursor, *args) выполняет одну операцию и возвращает ее результат;
+    submit возвращает Future, который завершается после коммита.
+    Если группа не записалась, операции повторяются по одной, и ошибку
+    получает только Future неудачной операции
+    """
+
+    def __init__(self, pool, write_fn, interval_ms=0, max_batch_size=256):
+        self.pool = pool
+        self.write_fn = write_fn
+        self.interval = interval_ms / 1000.0
+        self.max_batch_size = max_batch_size
+
+        self._stopped = False
+        self._start()
+
+        # Поток записи перезапускается в дочернем процессе после fork
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: _reset_after_fork(ref))
+
+    def _start(self):
+        """Создание очереди и запуск потока записи"""
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def _reset_after_fork(self):
+        """Новый поток записи в дочернем процессе"""
+        if not self._stopped:
+            self._start()
+
+    def submit(self, *args):
+        """Постановка операции записи в очередь"""
+        future = Future()
+        self._queue.put((args, future))
+        return future
+
+    def _collect(self):
+        """
+        Сбор группы операций: все, что уже стоит в очереди, плюс то,
+        что успевает поступить в пределах interval_ms между операциями.
+        Пока идет коммит предыдущей группы, новые операции копятся в очереди
+        """
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.perf_counter() + self.interval
+        while len(batch) < self.max_batch_size:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if entry is None:
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        """Основной цикл потока записи"""
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+
+            conn = self.pool.acquire()
+            try:
+                cursor = conn.cursor()
+                results = [self.write_fn(cursor, *args) for args, _ in batch]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                # Ошибочная операция не должна отменять чужие записи:
+                # повторяем группу по одной операции в своей транзакции
+                for args, future in batch:
+                    self._write_one(conn, args, future)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            finally:
+                self.pool.release(conn)
+
+    def _write_one(self, conn, args, future):
+        """Одна операция в отдельной транзакции"""
+        try:
+            result = self.write_fn(conn.cursor(), *args)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    def close(self):
+        """Остановка потока после записи уже поставленных операций"""
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,154 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import STAGE_BUCKETS, Histogram
+
+
+def _set_torch_threads(threads):
+    """
+    Число потоков intra-op PyTorch для вызывающего потока, возвращает прежнее.
+    В сборках с OpenMP значение хранится для каждого потока отдельно
+    """
+    try:
+        import torch
+    except ImportError:
+        return None
+    previous = torch.get_num_threads()
+    if threads and threads != previous:
+        torch.set_num_threads(threads)
+    return previous
+
+
+def _set_affinity(cores):
+    """Привязка вызывающего потока к ядрам cores (Linux), возвращает прежнюю привязку"""
+    if not cores or not hasattr(os, 'sched_setaffinity'):
+        return None
+    # pid 0 в Linux - вызывающий поток, а не весь процесс
+    previous = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, cores)
+    return previous
+
+
+class Replica:
+    """Копия модели с бюджетом потоков и (опционально) набором ядер"""
+
+    def __init__(self, index, detector, threads=0, cores=None):
+        self.index = index
+        self.detector = detector
+        self.threads = threads
+        self.cores = cores
+        self.calls = 0
+        self.busy_seconds = 0.0
+
+    @contextmanager
+    def budget(self):
+        """Ограничение потоков и привязка к ядрам на время вызова модели"""
+        previous_affinity = _set_affinity(self.cores)
+        previous_threads = _set_torch_threads(self.threads)
+        try:
+            yield self.detector
+        finally:
+            if previous_threads is not None:
+                _set_torch_threads(previous_threads)
+            if previous_affinity is not None:
+                os.sched_setaffinity(0, previous_affinity)
+
+
+def partition_cores(replicas, threads, cores=None):
+    """
+    Раскладка ядер по репликам: реплика i получает threads ядер подряд
+    (по кругу, если ядер меньше, чем replicas * threads)
+    """
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') \
+            else list(range(os.cpu_count() or 1))
+    return [{cores[(i * threads + j) % len(cores)] for j in range(threads)}
+            for i in range(replicas)]
+
+
+class DetectorPool:
+    """
+    Пул реплик FruitDetector для параллельных вызовов модели.
+
+    Без пула все потоки Flask вызывают одну модель, и каждый инференс
+    PyTorch занимает все ядра: потоки мешают друг другу, задержка растет
+    у всех. В пуле каждая из replicas копий получает threads потоков
+    intra-op (0 - поровну делим доступные ядра), при pin_cores поток,
+    взявший реплику, привязывается к ее ядрам. Вызывающий берет свободную
+    реплику через checkout() и возвращает ее по выходу из блока.
+
+    factory() создает детектор; первая реплика может быть уже загруженным
+    детектором (primary), чтобы не загружать модель повторно
+    """
+
+    def __init__(self, factory, replicas=1, threads=0, pin_cores=False, primary=None):
+        replicas = max(1, int(replicas))
+        cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') \
+            else (os.cpu_count() or 1)
+        self.threads = threads or max(1, cpu_count // replicas)
+        self.pin_cores = pin_cores
+
+        layout = partition_cores(replicas, self.threads) if pin_cores else [None] * replicas
+
+        self.replicas = []
+        self._idle = queue.Queue()
+        for index in range(replicas):
+            detector = primary if index == 0 and primary is not None else factory()
+            replica = Replica(index, detector, self.threads, layout[index])
+            self.replicas.append(replica)
+            self._idle.put(replica)
+
+        self.wait_histogram = Histogram(STAGE_BUCKETS)
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        """Детектор первой реплики (для операций без инференса)"""
+        return self.replicas[0].detector
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """Свободная реплика на время блока with (ожидание не дольше timeout)"""
+        started = time.perf_counter()
+        try:
+            replica = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError('No idle detector replica') from None
+        checked_out = time.perf_counter()
+        self.wait_histogram.observe(checked_out - started)
+
+        try:
+            with replica.budget() as detector:
+                yield detector
+        finally:
+            with self._lock:
+                replica.calls += 1
+                replica.busy_seconds += time.perf_counter() - checked_out
+            self._idle.put(replica)
+
+    def warmup(self):
+        """Прогрев всех реплик с их бюджетом потоков"""
+        for replica in self.replicas:
+            with replica.budget() as detector:
+                detector.warmup()
+
+    def stats(self):
+        """Раскладка реплик, их загрузка и ожидание свободной реплики"""
+        with self._lock:
+            replicas = [{
+                'index': replica.index,
+                'threads': replica.threads,
+                'cores': sorted(replica.cores) if replica.cores else None,
+                'calls': replica.calls,
+                'busy_seconds': round(replica.busy_seconds, 4)
+            } for replica in self.replicas]
+        return {
+            'replicas': replicas,
+            'idle': self._idle.qsize(),
+            'threads_per_replica': self.threads,
+            'pin_cores': self.pin_cores,
+            'checkout_wait_seconds': self.wait_histogram.snapshot()
+        }
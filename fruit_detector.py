@@ -1,18 +1,59 @@
-import torch
 import cv2
 import numpy as np
 from PIL import Image
-from ultralytics import YOLO
 import os
+import io
+import json
+import hashlib
+import time
+
+from backends import prepare_model
+from metrics import tracer
+from tiling import cut_by_tile_edge, make_tiles, merge_detections
+from tracker import FruitTracker
+from video_pipeline import FrameReader, MotionSampler
+
+def draw_detections(image, detections):
+    """
+    Отрисовка рамок и подписей на изображении (на месте).
+    detections - детекции в колоночном виде (fruit, confidence, bbox)
+    """
+    for fruit_name, confidence, bbox in zip(detections['fruit'],
+                                            detections['confidence'],
+                                            detections['bbox']):
+        x1, y1, x2, y2 = (int(v) for v in bbox)
+        
+        # Рисуем bounding box на изображении
+        cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        
+        # Добавляем текст с названием фрукта и уверенностью
+        label = f"{fruit_name}: {confidence:.2f}"
+        cv2.putText(image, label, (x1, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    
+    return image
 
 class FruitDetector:
-    def __init__(self, model_path='yolov8n.pt'):
+    def __init__(self, model_path='yolov8n.pt', backend='torch', tile_mode='auto',
+                 tile_size=640, tile_overlap=0.2, tile_min_side=1920, tile_batch_size=8,
+                 calibration_data=None):
         """
-        Инициализация детектора фруктов с предобученной моделью YOLOv8
+        Инициализация детектора фруктов с предобученной моделью YOLOv8.
+        backend - движок инференса: 'torch', 'onnx', 'onnx-int8', 'openvino'
+        или 'openvino-int8' (модель экспортируется при первом запуске,
+        calibration_data - калибровочный набор для openvino-int8).
+        tile_mode - плиточная детекция больших снимков: 'off', 'on' или
+        'auto' (только если большая сторона не меньше tile_min_side)
         """
         # Используем YOLOv8 - современную и быструю модель для детекции объектов
         # Модель автоматически скачается при первом запуске
-        self.model = YOLO(model_path)
+        # ultralytics (и torch) импортируются только при создании детектора
+        from ultralytics import YOLO
+        
+        self.model_path = model_path
+        self.backend = backend
+        self.model = YOLO(prepare_model(model_path, backend,
+                                        calibration_data=calibration_data), task='detect')
         
         # Классы фруктов в COCO dataset (базовая модель знает основные фрукты)
         self.fruit_classes = {
@@ -27,126 +68,390 @@ class FruitDetector:
             55: 'cake'
         }
         
+        # Таблица "ID класса -> название" для векторной обработки результатов
+        self._class_ids = np.array(list(self.fruit_classes.keys()), dtype=np.int64)
+        self._class_names = np.empty(int(self._class_ids.max()) + 1, dtype=object)
+        for class_id, fruit_name in self.fruit_classes.items():
+            self._class_names[class_id] = fruit_name
+        
         # Настройки детекции
         self.confidence_threshold = 0.25
         self.iou_threshold = 0.45
         
-    def detect_fruits(self, image_path):
+        # Настройки плиточной детекции
+        self.tile_mode = tile_mode
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tile_min_side = tile_min_side
+        self.tile_batch_size = tile_batch_size
+        # Дополнительный проход по всему кадру для крупных фруктов,
+        # которые не помещаются в одну плитку
+        self.tile_include_full = True
+        self.tile_merge_threshold = 0.5
+    
+    def config_fingerprint(self):
         """
-        Обнаружение фруктов на изображении
+        Отпечаток конфигурации модели: меняется при смене весов,
+        порогов или списка классов (используется в ключе кэша)
         """
-        try:
-            # Загрузка изображения
-            image = Image.open(image_path)
-            img_array = np.array(image)
-            
-            # Детекция объектов с помощью YOLOv8
-            results = self.model(
-                source=img_array,
+        config = json.dumps({
+            'model': os.path.basename(self.model_path),
+            'backend': self.backend,
+            'conf': self.confidence_threshold,
+            'iou': self.iou_threshold,
+            'classes': sorted(self.fruit_classes.items()),
+            'tiles': [self.tile_mode, self.tile_size, self.tile_overlap,
+                      self.tile_min_side, self.tile_include_full,
+                      self.tile_merge_threshold]
+        }, sort_keys=True)
+        return hashlib.sha1(config.encode('utf-8')).hexdigest()[:16]
+    
+    def warmup(self, size=640):
+        """
+        Прогревочный инференс на пустом изображении: инициализация
+        бэкенда и выделение буферов происходят до первого запроса
+        """
+        self._predict(np.zeros((size, size, 3), dtype=np.uint8))
+    
+    def decode_image(self, data):
+        """
+        Декодирование изображения из байтов в памяти в numpy массив BGR
+        (порядок каналов, который YOLO ожидает для массивов)
+        """
+        with tracer.stage('decode'):
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                # Форматы, которые OpenCV не читает (например, GIF)
+                image = np.array(Image.open(io.BytesIO(data)).convert('RGB'))
+                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            return image
+    
+    def load_image(self, image_path):
+        """
+        Загрузка изображения в виде numpy массива (BGR)
+        """
+        with open(image_path, 'rb') as f:
+            return self.decode_image(f.read())
+    
+    def _predict(self, source):
+        """
+        Запуск модели на одном изображении или на списке изображений (батч)
+        """
+        with tracer.stage('inference'):
+            return self.model(
+                source=source,
                 conf=self.confidence_threshold,
                 iou=self.iou_threshold,
                 classes=list(self.fruit_classes.keys())  # Только фрукты
             )
+    
+    def detect_fruits(self, image_path, annotate=True):
+        """
+        Обнаружение фруктов на изображении.
+        При annotate=False возвращаются только счетчики и детекции
+        """
+        try:
+            # Загрузка изображения
+            img_array = self.load_image(image_path)
             
-            # Обработка результатов
-            detections = []
-            total_fruits = 0
-            fruit_counts = {}
+            return self.detect_image(img_array, image_path, annotate)
             
-            # Создаем копию изображения для аннотаций
-            annotated_img = img_array.copy()
+        except Exception as e:
+            print(f"Ошибка при детекции: {str(e)}")
+            return None
+    
+    def detect_bytes(self, data, image_path, annotate=True):
+        """
+        Детекция на изображении из памяти (тело запроса) без записи
+        оригинала на диск. image_path - имя, по которому называется результат
+        """
+        try:
+            img_array = self.decode_image(data)
+            return self.detect_image(img_array, image_path, annotate)
             
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        # Координаты ограничивающего прямоугольника
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        confidence = box.conf[0].cpu().numpy()
-                        class_id = int(box.cls[0].cpu().numpy())
-                        
-                        # Проверяем, что это фрукт из нашего списка
-                        if class_id in self.fruit_classes:
-                            fruit_name = self.fruit_classes[class_id]
-                            
-                            # Добавляем детекцию в список
-                            detection = {
-                                'fruit': fruit_name,
-                                'confidence': float(confidence),
-                                'bbox': [float(x1), float(y1), float(x2), float(y2)],
-                                'area': float((x2 - x1) * (y2 - y1))
-                            }
-                            detections.append(detection)
-                            
-                            # Обновляем счетчики
-                            total_fruits += 1
-                            fruit_counts[fruit_name] = fruit_counts.get(fruit_name, 0) + 1
-                            
-                            # Рисуем bounding box на изображении
-                            cv2.rectangle(annotated_img, 
-                                        (int(x1), int(y1)), 
-                                        (int(x2), int(y2)), 
-                                        (0, 255, 0), 2)
-                            
-                            # Добавляем текст с названием фрукта и уверенностью
-                            label = f"{fruit_name}: {confidence:.2f}"
-                            cv2.putText(annotated_img, label, 
-                                      (int(x1), int(y1) - 10),
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, 
-                                      (0, 255, 0), 2)
+        except Exception as e:
+            print(f"Ошибка при детекции: {str(e)}")
+            return None
+    
+    def detect_image(self, img_array, image_path=None, annotate=True):
+        """
+        Детекция на уже декодированном изображении BGR (numpy массив передается
+        в модель без копирования). Аннотации рисуются прямо на img_array;
+        при annotate=False изображение не меняется и не сохраняется
+        """
+        if self.should_tile(img_array):
+            return self.detect_tiled(img_array, image_path, annotate)
+        
+        # Детекция объектов с помощью YOLOv8
+        results = self._predict(img_array)
+        return self._build_statistics(results, img_array, image_path, annotate)
+    
+    def should_tile(self, img_array):
+        """Нужна ли плиточная детекция для изображения"""
+        if self.tile_mode == 'on':
+            return True
+        if self.tile_mode == 'auto':
+            return max(img_array.shape[:2]) >= self.tile_min_side
+        return False
+    
+    def detect_tiled(self, img_array, image_path=None, annotate=True):
+        """
+        Плиточная детекция: изображение режется на перекрывающиеся плитки
+        размера входа модели (срезы numpy без копирования), плитки батчами
+        проходят через модель, рамки переводятся в координаты изображения
+        и объединяются глобальным NMS
+        """
+        height, width = img_array.shape[:2]
+        tiles = make_tiles(height, width, self.tile_size, self.tile_overlap)
+        
+        sources = [img_array[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+        if self.tile_include_full and len(tiles) > 1:
+            sources.append(img_array)
+            tiles = tiles + [(0, 0, width, height)]
+        
+        xyxy, confidences, class_ids, source_ids, cut = [], [], [], [], []
+        for start in range(0, len(sources), self.tile_batch_size):
+            chunk = sources[start:start + self.tile_batch_size]
+            results = self._predict(chunk)
+            for index, result in enumerate(results, start):
+                boxes, scores, classes = self._extract_detections([result])
+                boxes[:, [0, 2]] += tiles[index][0]
+                boxes[:, [1, 3]] += tiles[index][1]
+                xyxy.append(boxes)
+                confidences.append(scores)
+                class_ids.append(classes)
+                source_ids.append(np.full(len(boxes), index))
+                cut.append(cut_by_tile_edge(boxes, tiles[index], height, width))
+        
+        xyxy = np.concatenate(xyxy)
+        confidences = np.concatenate(confidences)
+        class_ids = np.concatenate(class_ids)
+        
+        # Один фрукт, попавший в несколько плиток, считается один раз;
+        # соседние фрукты внутри одной плитки не сливаются
+        with tracer.stage('tile_merge'):
+            keep = merge_detections(xyxy, confidences, class_ids,
+                                    self.tile_merge_threshold, self.iou_threshold,
+                                    np.concatenate(source_ids), np.concatenate(cut))
+        return self._statistics_from_arrays(xyxy[keep], confidences[keep], class_ids[keep],
+                                            img_array, image_path, annotate)
+    
+    def detect_arrays(self, images):
+        """
+        Пакетная детекция на массивах без аннотаций (для видео и потоков)
+        """
+        results = self._predict(list(images))
+        return [self._build_statistics([result], img_array, annotate=False)
+                for result, img_array in zip(results, images)]
+    
+    def detect_batch(self, images, image_paths, annotate=True):
+        """
+        Пакетная детекция: все изображения батча проходят через модель
+        одним вызовом, каждому вызывающему возвращается своя статистика.
+        annotate - общий флаг или список флагов для каждого изображения
+        """
+        statistics = [None] * len(images)
+        if isinstance(annotate, bool):
+            annotate = [annotate] * len(images)
+        
+        # Большие снимки обрабатываются плитками, остальные - одним батчем
+        tiled = [i for i, img_array in enumerate(images) if self.should_tile(img_array)]
+        for i in tiled:
+            try:
+                statistics[i] = self.detect_tiled(images[i], image_paths[i], annotate[i])
+            except Exception as e:
+                print(f"Ошибка при детекции: {str(e)}")
+        
+        batch = [i for i in range(len(images)) if i not in tiled]
+        if not batch:
+            return statistics
+        
+        try:
+            results = self._predict([images[i] for i in batch])
+        except Exception as e:
+            print(f"Ошибка при пакетной детекции: {str(e)}")
+            return statistics
+        
+        for i, result in zip(batch, results):
+            try:
+                statistics[i] = self._build_statistics([result], images[i], image_paths[i],
+                                                       annotate[i])
+            except Exception as e:
+                print(f"Ошибка при детекции: {str(e)}")
+        
+        return statistics
+    
+    def _extract_detections(self, results):
+        """
+        Извлечение результатов модели целыми массивами: одна передача
+        с устройства на хост на каждый тензор, фильтрация классов в numpy
+        """
+        xyxy, confidences, class_ids = [], [], []
+        for result in results:
+            boxes = result.boxes
+            if boxes is None or len(boxes) == 0:
+                continue
+            xyxy.append(boxes.xyxy.cpu().numpy())
+            confidences.append(boxes.conf.cpu().numpy())
+            class_ids.append(boxes.cls.cpu().numpy())
+        
+        if not xyxy:
+            return (np.empty((0, 4), dtype=np.float32),
+                    np.empty(0, dtype=np.float32),
+                    np.empty(0, dtype=np.int64))
+        
+        xyxy = np.concatenate(xyxy).astype(np.float32, copy=False)
+        confidences = np.concatenate(confidences).astype(np.float32, copy=False)
+        class_ids = np.concatenate(class_ids).astype(np.int64)
+        
+        # Оставляем только фрукты из нашего списка
+        mask = np.isin(class_ids, self._class_ids)
+        return xyxy[mask], confidences[mask], class_ids[mask]
+    
+    def _build_statistics(self, results, img_array, image_path=None, annotate=True):
+        """
+        Обработка результатов модели: подсчет, аннотации и сохранение изображения
+        """
+        with tracer.stage('extract'):
+            xyxy, confidences, class_ids = self._extract_detections(results)
+        return self._statistics_from_arrays(xyxy, confidences, class_ids,
+                                            img_array, image_path, annotate)
+    
+    def _statistics_from_arrays(self, xyxy, confidences, class_ids, img_array,
+                                image_path=None, annotate=True):
+        """
+        Статистика по массивам рамок, уверенностей и классов
+        """
+        with tracer.stage('postprocess'):
+            # Подсчет по классам одним проходом
+            counts = np.bincount(class_ids, minlength=len(self._class_names))
+            fruit_counts = {}
+            for class_id in np.flatnonzero(counts):
+                fruit_name = self._class_names[class_id]
+                fruit_counts[fruit_name] = fruit_counts.get(fruit_name, 0) + int(counts[class_id])
             
-            # Сохраняем аннотированное изображение
-            result_path = os.path.join('static', 'results', 
-                                     f'result_{os.path.basename(image_path)}')
-            cv2.imwrite(result_path, cv2.cvtColor(annotated_img, cv2.COLOR_RGB2BGR))
+            areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
             
-            # Подготавливаем статистику
-            statistics = {
-                'total_fruits': total_fruits,
-                'fruit_counts': fruit_counts,
-                'detections': detections,
-                'result_image': result_path,
-                'original_image': image_path
+            # Детекции в колоночном виде
+            detections = {
+                'fruit': self._class_names[class_ids].tolist(),
+                'confidence': confidences.tolist(),
+                'bbox': xyxy.tolist(),
+                'area': areas.tolist()
             }
+        
+        # Сохраняем аннотированное изображение
+        result_path = None
+        if annotate and image_path:
+            with tracer.stage('annotate'):
+                # Рисуем на исходном массиве: после детекции он больше не нужен
+                draw_detections(img_array, detections)
             
-            return statistics
-            
-        except Exception as e:
-            print(f"Ошибка при детекции: {str(e)}")
-            return None
+            result_path = os.path.join('static', 'results', 
+                                     f'result_{os.path.basename(image_path)}')
+            with tracer.stage('write_result'):
+                cv2.imwrite(result_path, img_array)
+        
+        # Подготавливаем статистику
+        statistics = {
+            'total_fruits': int(len(class_ids)),
+            'fruit_counts': fruit_counts,
+            'detections': detections,
+            'result_image': result_path,
+            'original_image': image_path
+        }
+        
+        return statistics
+    
+    def count_from_video(self, video_path, frame_interval=10, track=False, count_line=None,
+                         adaptive=False, min_interval=1, max_interval=30):
+        """
+        Подсчет фруктов из видео (для конвейера).
+        При track=True каждый фрукт получает ID и считается один раз,
+        при adaptive=True кадры для модели выбираются по движению
+        """
+        return self.process_video(video_path, frame_interval,
+                                  track=track, count_line=count_line,
+                                  adaptive=adaptive, min_interval=min_interval,
+                                  max_interval=max_interval)['fruit_counts']
     
-    def count_from_video(self, video_path, frame_interval=10):
+    def process_video(self, video_path, frame_interval=10, batch_size=8, queue_size=32,
+                      track=False, count_line=None, count_axis='y', adaptive=False,
+                      min_interval=1, max_interval=30, motion_threshold=0.002):
         """
-        Подсчет фруктов из видео (для конвейера)
+        Потоковая обработка видео: кадры декодируются в отдельном потоке
+        в ограниченную очередь и батчами передаются в модель напрямую
+        из памяти, без промежуточных JPEG файлов.
+        
+        Без трекинга суммируются детекции всех обработанных кадров.
+        С трекингом (track=True) считаются уникальные фрукты; count_line
+        включает подсчет по пересечению линии на конвейере.
+        
+        При adaptive=True вместо фиксированного frame_interval оценивается
+        движение на каждом кадре: в покое модель вызывается не чаще раза
+        в max_interval кадров, при движении - до каждого min_interval-го кадра
+        (см. MotionSampler). frames_inferred и frames_skipped в результате
+        показывают, сколько кадров ушло в модель и сколько пропущено
+        (по движению при adaptive, иначе - шагом frame_interval)
         """
-        cap = cv2.VideoCapture(video_path)
-        frame_count = 0
+        start_time = time.time()
         total_counts = {}
+        frames_processed = 0
+        batch = []
         
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            if frame_count % frame_interval == 0:
-                # Конвертируем кадр для обработки
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                # Временное сохранение кадра
-                temp_path = f'temp_frame_{frame_count}.jpg'
-                cv2.imwrite(temp_path, frame)
-                
-                # Детекция на кадре
-                stats = self.detect_fruits(temp_path)
-                
-                if stats:
-                    for fruit, count in stats['fruit_counts'].items():
-                        total_counts[fruit] = total_counts.get(fruit, 0) + count
-                
-                # Удаляем временный файл
-                os.remove(temp_path)
-            
-            frame_count += 1
+        tracker = None
+        if track or count_line is not None:
+            tracker = FruitTracker(count_line=count_line, count_axis=count_axis)
+        
+        def flush(frames):
+            # Кадры OpenCV уже в формате BGR, который ожидает YOLO для numpy массивов
+            for stats in self.detect_arrays(frames):
+                if tracker is not None:
+                    detections = stats['detections']
+                    tracker.update(detections['bbox'], detections['fruit'])
+                    continue
+                for fruit, count in stats['fruit_counts'].items():
+                    total_counts[fruit] = total_counts.get(fruit, 0) + count
+            return len(frames)
+        
+        sampler = None
+        if adaptive:
+            sampler = MotionSampler(min_interval, max_interval, motion_threshold)
+            frame_interval = 1
+        
+        with FrameReader(video_path, frame_interval, queue_size, sampler=sampler) as reader:
+            for _, frame in reader:
+                batch.append(frame)
+                if len(batch) >= batch_size:
+                    frames_processed += flush(batch)
+                    batch = []
             
-        cap.release()
-        return total_counts
+            if batch:
+                frames_processed += flush(batch)
+        
+        if reader.error is not None:
+            print(f"Ошибка при чтении видео: {str(reader.error)}")
+        
+        elapsed = time.time() - start_time
+        
+        if tracker is not None:
+            total_counts = dict(tracker.unique_counts)
+        
+        if sampler is not None:
+            frames_inferred = sampler.frames_inferred
+            frames_skipped = sampler.frames_skipped
+        else:
+            frames_inferred = frames_processed
+            frames_skipped = reader.frames_read - frames_processed
+        
+        return {
+            'fruit_counts': total_counts,
+            'total_fruits': sum(total_counts.values()),
+            'frames_read': reader.frames_read,
+            'frames_processed': frames_processed,
+            'frames_inferred': frames_inferred,
+            'frames_skipped': frames_skipped,
+            'tracks': tracker.total_tracks if tracker is not None else None,
+            'processing_time': elapsed,
+            'fps': reader.frames_read / elapsed if elapsed > 0 else 0.0
+        }
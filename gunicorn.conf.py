@@ -0,0 +1,33 @@
+"""
+Запуск в режиме preload-and-fork:
+    gunicorn -c gunicorn.conf.py app:app
+
+Приложение (вместе с моделью) загружается один раз в мастер-процессе,
+рабочие процессы получают веса через fork без копирования (copy-on-write).
+
+По умолчанию работает один процесс с пулом потоков (gthread): видеопотоки
+(/streams), состояние фоновой генерации отчетов (/reports/<id>/<type>)
+и индекс хранения файлов с квотой FRUIT_RETENTION_MAX_BYTES живут в памяти
+процесса. Состояние асинхронных задач (/jobs) хранится в БД и доступно
+любому процессу. При FRUIT_WEB_WORKERS > 1 каждый процесс видит только
+свои потоки и отчеты, а квота хранения действует в каждом процессе отдельно
+"""
+import gc
+import os
+
+bind = os.environ.get('FRUIT_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('FRUIT_WEB_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('FRUIT_WEB_THREADS', 8))
+preload_app = True
+
+
+def when_ready(server):
+    """Заморозка объектов мастера: сборщик мусора не трогает их страницы в рабочих процессах"""
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Поток очистки файлов запускается заново в рабочем процессе (потоки не переживают fork)"""
+    from app import retention
+    retention.restart_after_fork()
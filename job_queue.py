@@ -0,0 +1,223 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import tracer
+
+# Детектор, загружаемый один раз в каждом рабочем процессе
+_worker_detector = None
+
+
+def _init_worker(model_path, detector_options=None):
+    """Инициализация рабочего процесса: предзагрузка модели"""
+    global _worker_detector
+    if _worker_detector is not None:
+        # Детектор унаследован от родителя при fork: веса общие (copy-on-write)
+        return
+    from fruit_detector import FruitDetector
+    _worker_detector = FruitDetector(model_path, **(detector_options or {}))
+
+
+def _run_detection(filepath, annotate=True):
+    """Детекция в рабочем процессе, возвращает статистику, время обработки и этапы"""
+    start_time = time.time()
+    tracer.begin()
+    try:
+        statistics = _worker_detector.detect_fruits(filepath, annotate)
+    finally:
+        stage_timings = tracer.end()
+    return statistics, time.time() - start_time, stage_timings
+
+
+def wait_stored_job(store, job_id, timeout=None, poll_interval=0.5):
+    """
+    Ожидание завершения задачи по общему хранилищу (задача другого процесса):
+    опрос store раз в poll_interval секунд, не дольше timeout секунд
+    """
+    deadline = time.time() + (timeout if timeout is not None else float('inf'))
+    while True:
+        job = store.get_job(job_id)
+        if job is None or job['finished'] is not None or time.time() >= deadline:
+            return job
+        time.sleep(poll_interval)
+
+
+class QueueFullError(Exception):
+    """Очередь задач переполнена (admission control)"""
+    pass
+
+
+class JobQueue:
+    """
+    Асинхронная очередь задач детекции с пулом рабочих процессов.
+    
+    Каждый процесс держит свой предзагруженный FruitDetector.
+    Количество незавершенных задач ограничено max_pending: при
+    переполнении submit выбрасывает QueueFullError.
+    on_complete(statistics, processing_time, context, stage_timings) вызывается
+    в основном процессе после успешной детекции (сохранение в БД и т.п.),
+    context - произвольное значение, переданное в submit, stage_timings -
+    длительности этапов, замеренные в рабочем процессе; его результат
+    сохраняется в задаче как request_id;
+    detector_options - параметры FruitDetector в рабочих процессах;
+    detector - уже загруженный детектор, который рабочие процессы
+    наследуют при fork вместо повторной загрузки модели;
+    store - общее хранилище состояния задач (save_job, get_job,
+    delete_finished_jobs): задачу видит любой процесс веб-сервера,
+    а не только тот, который ее принял
+    """
+    
+    def __init__(self, workers=2, max_pending=32, model_path='yolov8n.pt',
+                 on_complete=None, result_ttl=3600, detector_options=None,
+                 detector=None, store=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.on_complete = on_complete
+        self.result_ttl = result_ttl
+        self.store = store
+        
+        if detector is not None:
+            global _worker_detector
+            _worker_detector = detector
+
+        self._executor = ProcessPoolExecutor(max_workers=workers,
+                                             initializer=_init_worker,
+                                             initargs=(model_path, detector_options))
+        self._jobs = {}
+        self._pending = 0
+        self._cond = threading.Condition()
+    
+    def submit(self, filepath, annotate=True, context=None):
+        """Постановка задачи, возвращает ID задачи"""
+        with self._cond:
+            if self._pending >= self.max_pending:
+                raise QueueFullError('Too many pending jobs')
+            
+            self._prune()
+            
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'id': job_id,
+                'status': 'queued',
+                'created': time.time(),
+                'finished': None,
+                'statistics': None,
+                'processing_time': None,
+                'error': None,
+                'request_id': None,
+                'context': context,
+                'future': None
+            }
+            self._pending += 1
+            snapshot = self._snapshot(self._jobs[job_id])
+        
+        if self.store is not None:
+            self.store.save_job(snapshot)
+            self.store.delete_finished_jobs(time.time() - self.result_ttl)
+        
+        try:
+            future = self._executor.submit(_run_detection, filepath, annotate)
+        except Exception:
+            with self._cond:
+                job = self._jobs.pop(job_id)
+                self._pending -= 1
+            if self.store is not None:
+                job.update(status='failed', error='Failed to submit job', finished=time.time())
+                self.store.save_job(self._snapshot(job))
+            raise
+        
+        with self._cond:
+            self._jobs[job_id]['future'] = future
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        return job_id
+    
+    def _finish(self, job_id, future):
+        """Обработка завершения задачи"""
+        statistics, processing_time, error, request_id = None, None, None, None
+        try:
+            statistics, processing_time, stage_timings = future.result()
+            if not statistics:
+                error = 'Failed to process image'
+            elif self.on_complete is not None:
+                with self._cond:
+                    context = self._jobs[job_id]['context']
+                request_id = self.on_complete(statistics, processing_time, context,
+                                              stage_timings)
+        except Exception as e:
+            error = str(e)
+        
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job['status'] = 'failed' if error else 'done'
+                job['statistics'] = statistics
+                job['processing_time'] = processing_time
+                job['error'] = error
+                job['request_id'] = request_id
+                job['finished'] = time.time()
+                snapshot = self._snapshot(job)
+            self._pending -= 1
+            self._cond.notify_all()
+        
+        if self.store is not None and job is not None:
+            try:
+                self.store.save_job(snapshot)
+            except Exception as e:
+                print(f"Ошибка при сохранении задачи {job_id}: {str(e)}")
+    
+    def _prune(self):
+        """Удаление давно завершенных задач (вызывается под блокировкой)"""
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finished'] is not None and now - job['finished'] > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+    
+    def _snapshot(self, job):
+        """Копия состояния задачи без служебных полей"""
+        snapshot = {key: value for key, value in job.items()
+                    if key not in ('future', 'context')}
+        future = job['future']
+        if snapshot['status'] == 'queued' and future is not None and future.running():
+            snapshot['status'] = 'running'
+        return snapshot
+    
+    def get(self, job_id):
+        """Текущее состояние задачи или None (задачи других процессов - из store)"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return self._snapshot(job)
+        return self.store.get_job(job_id) if self.store is not None else None
+    
+    def wait(self, job_id, timeout=None, poll_interval=0.5):
+        """
+        Ожидание завершения задачи (не дольше timeout секунд).
+        Задача другого процесса опрашивается в store раз в poll_interval секунд
+        """
+        with self._cond:
+            local = job_id in self._jobs
+        if not local and self.store is not None:
+            return wait_stored_job(self.store, job_id, timeout, poll_interval)
+        
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._jobs.get(job_id, {}).get('finished', 0) is not None,
+                timeout=timeout
+            )
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job is not None else None
+    
+    def stats(self):
+        """Загрузка очереди"""
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'pending': self._pending,
+                'max_pending': self.max_pending
+            }
+    
+    def shutdown(self):
+        """Остановка пула процессов"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,191 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+# Границы корзин для длительностей этапов обработки, секунды
+STAGE_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Общий контекст-заглушка для выключенной трассировки (без выделения памяти)
+_NULL_STAGE = nullcontext()
+
+
+class Histogram:
+    """
+    Потокобезопасная гистограмма с фиксированными границами корзин
+    (в стиле Prometheus: корзина включает значения <= своей границы)
+    """
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        # Последняя корзина - для значений больше всех границ (+Inf)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Добавление одного наблюдения"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля по верхней границе корзины"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if total == 0:
+            return 0.0
+
+        rank = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        # Значение вне всех корзин: возвращаем последнюю границу как оценку снизу
+        return self.buckets[-1] if self.buckets else 0.0
+
+    def snapshot(self):
+        """Снимок гистограммы с накопительными значениями по корзинам"""
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+            total = self._count
+
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets['+Inf'] = total
+
+        return {
+            'buckets': buckets,
+            'count': total,
+            'sum': round(total_sum, 6),
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99)
+        }
+
+    def prometheus(self, name, labels=None):
+        """Строки гистограммы в текстовом формате Prometheus"""
+        snapshot = self.snapshot()
+        labels = dict(labels or {})
+        base = ','.join(f'{key}="{value}"' for key, value in labels.items())
+        prefix = f'{base},' if base else ''
+        suffix = f'{{{base}}}' if base else ''
+
+        lines = [f'{name}_bucket{{{prefix}le="{bound}"}} {count}'
+                 for bound, count in snapshot['buckets'].items()]
+        lines.append(f'{name}_sum{suffix} {snapshot["sum"]}')
+        lines.append(f'{name}_count{suffix} {snapshot["count"]}')
+        return lines
+
+
+class StageTracer:
+    """
+    Замер длительности этапов обработки (декодирование, инференс,
+    запись в БД и т.д.).
+
+    Каждый этап попадает в гистограмму своего имени; если в текущем
+    потоке начата трассировка запроса (begin), длительность также
+    добавляется в ее словарь этапов. При enabled=False stage()
+    возвращает общий пустой контекст и почти ничего не стоит
+    """
+
+    def __init__(self, enabled=True, buckets=None):
+        self.enabled = enabled
+        self.buckets = buckets or STAGE_BUCKETS
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def stage(self, name):
+        """Контекстный менеджер для замера этапа"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._timed_stage(name)
+
+    @contextmanager
+    def _timed_stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """Учет длительности этапа в гистограмме и в трассировке потока"""
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(self.buckets))
+        histogram.observe(seconds)
+
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace[name] = trace.get(name, 0.0) + seconds
+
+    def observe(self, timings):
+        """Учет этапов, замеренных в другом процессе (например, в пуле задач)"""
+        if self.enabled:
+            for name, seconds in (timings or {}).items():
+                self.record(name, seconds)
+
+    def merge(self, timings):
+        """Добавление этапов из другого потока в трассировку текущего (без гистограмм)"""
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            for name, seconds in (timings or {}).items():
+                trace[name] = trace.get(name, 0.0) + seconds
+
+    def begin(self):
+        """Начало трассировки запроса в текущем потоке"""
+        self._local.trace = {} if self.enabled else None
+
+    def current(self):
+        """Этапы текущей трассировки (копия, секунды)"""
+        trace = getattr(self._local, 'trace', None)
+        return {name: round(seconds, 6) for name, seconds in (trace or {}).items()}
+
+    def end(self):
+        """Завершение трассировки, возвращает этапы запроса"""
+        timings = self.current()
+        self._local.trace = None
+        return timings
+
+    def snapshot(self):
+        """Снимки гистограмм всех этапов"""
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {name: histogram.snapshot() for name, histogram in sorted(histograms.items())}
+
+    def prometheus(self, name='fruit_stage_duration_seconds'):
+        """Гистограммы этапов в текстовом формате Prometheus (метка stage)"""
+        with self._lock:
+            histograms = dict(self._histograms)
+
+        lines = [f'# HELP {name} Duration of processing stages',
+                 f'# TYPE {name} histogram']
+        for stage, histogram in sorted(histograms.items()):
+            lines.extend(histogram.prometheus(name, {'stage': stage}))
+        return lines
+
+
+# Общий трассировщик этапов для всех модулей приложения
+tracer = StageTracer()
+
+
+@contextmanager
+def timed(timings, name):
+    """Замер длительности блока в секундах: timings[name]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - start, 4)
@@ -0,0 +1,125 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from fruit_detector import draw_detections
+from metrics import tracer
+
+# Форматы отрисованных изображений: расширение и параметры кодирования OpenCV
+IMAGE_FORMATS = {
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY)
+}
+
+IMAGE_MIMETYPES = {
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp'
+}
+
+
+class ResultRenderer:
+    """
+    Отрисовка аннотированных изображений по запросу.
+
+    При загрузке сохраняются только оригинал и детекции (таблица detections);
+    рамки рисуются при первом обращении к результату и кэшируются на диске
+    в cache_folder для каждого размера и формата. sizes - {имя: большая
+    сторона в пикселях}, 0 - исходный размер.
+    Запросы, для которых аннотированное изображение уже было сохранено
+    при загрузке (result_image), отрисовываются из него
+    """
+
+    def __init__(self, db_manager, upload_folder, cache_folder, sizes=None, quality=85):
+        self.db_manager = db_manager
+        self.upload_folder = upload_folder
+        self.cache_folder = cache_folder
+        self.sizes = sizes or {'thumb': 320, 'full': 0}
+        self.quality = quality
+
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def cache_path(self, request_id, size, image_format):
+        """Путь к отрисованному изображению в кэше"""
+        extension = IMAGE_FORMATS[image_format][0]
+        return os.path.join(self.cache_folder, f'{request_id}_{size}{extension}')
+
+    def render(self, request_id, size='full', image_format='jpeg'):
+        """
+        Путь к аннотированному изображению (из кэша или после отрисовки).
+        None - запроса нет или его исходное изображение уже удалено
+        """
+        if size not in self.sizes:
+            raise ValueError(f'Unknown size: {size}')
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f'Unknown format: {image_format}')
+
+        path = self.cache_path(request_id, size, image_format)
+        if os.path.exists(path):
+            return path
+
+        # Одновременные запросы одного изображения отрисовывают его один раз
+        with self._locks_lock:
+            lock = self._locks.setdefault(path, threading.Lock())
+        try:
+            with lock:
+                if os.path.exists(path):
+                    return path
+                with tracer.stage('render_result'):
+                    return self._render(request_id, size, image_format, path)
+        finally:
+            with self._locks_lock:
+                self._locks.pop(path, None)
+
+    def _load_source(self, request):
+        """Исходное изображение и детекции для отрисовки (None, если файла нет)"""
+        result_image = request['result_image']
+        if result_image and os.path.exists(result_image):
+            # Рамки уже нарисованы при загрузке
+            return cv2.imread(result_image), None
+
+        source = os.path.join(self.upload_folder, os.path.basename(request['filename'] or ''))
+        if not request['filename'] or not os.path.exists(source):
+            return None, None
+        with open(source, 'rb') as f:
+            image = cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+        return image, self.db_manager.get_detections(request['id'])
+
+    def _render(self, request_id, size, image_format, path):
+        """Отрисовка, масштабирование и запись в кэш"""
+        request = self.db_manager.get_request(request_id)
+        if request is None:
+            return None
+
+        image, detections = self._load_source(request)
+        if image is None:
+            return None
+
+        max_side = self.sizes[size]
+        scale = min(1.0, max_side / max(image.shape[:2])) if max_side else 1.0
+        if scale < 1.0:
+            # Уменьшаем до отрисовки: подписи на миниатюре остаются читаемыми
+            image = cv2.resize(image, (max(1, round(image.shape[1] * scale)),
+                                       max(1, round(image.shape[0] * scale))),
+                               interpolation=cv2.INTER_AREA)
+            if detections is not None:
+                detections = dict(detections)
+                detections['bbox'] = [[v * scale for v in bbox] for bbox in detections['bbox']]
+
+        if detections is not None:
+            draw_detections(image, detections)
+
+        extension, quality_flag = IMAGE_FORMATS[image_format]
+        ok, encoded = cv2.imencode(extension, image, [quality_flag, self.quality])
+        if not ok:
+            raise IOError(f'Не удалось закодировать изображение в {image_format}')
+
+        # Запись через временный файл: параллельный читатель не увидит половину файла
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp_path, path)
+        return path
@@ -1,22 +1,50 @@
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-import pandas as pd
 from datetime import datetime
+import csv
+import importlib.util
+import io
 import json
 import os
+import tempfile
+
+from metrics import tracer
+
+# Колонки отчета по истории: (заголовок, поле запроса)
+HISTORY_COLUMNS = [
+    ('Дата и время', 'timestamp'),
+    ('Файл', 'filename'),
+    ('Всего фруктов', 'total_fruits'),
+    ('Время обработки (сек)', 'processing_time')
+]
+
+# Форматы отчета по истории: расширение и MIME тип
+HISTORY_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+def history_format_available(report_format):
+    """Проверка, что для формата отчета установлены нужные библиотеки"""
+    if report_format == 'parquet':
+        return importlib.util.find_spec('pyarrow') is not None
+    return report_format in HISTORY_FORMATS
 
 class ReportGenerator:
     def __init__(self, output_dir='static/results'):
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
     
-    def generate_pdf_report(self, statistics, request_data):
+    def generate_pdf_report(self, statistics, request_data, filename=None):
         """Генерация PDF отчета"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"fruit_report_{timestamp}.pdf"
+        # reportlab импортируется только при генерации отчета (быстрый старт)
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import letter
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+        
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"fruit_report_{timestamp}.pdf"
         filepath = os.path.join(self.output_dir, filename)
         
         # Создаем PDF документ
@@ -61,13 +89,17 @@ class ReportGenerator:
         story.append(stats_table)
         
         # Сохраняем PDF
-        doc.build(story)
+        with tracer.stage('report_pdf'):
+            doc.build(story)
         return filepath
     
-    def generate_excel_report(self, statistics, request_data):
+    def generate_excel_report(self, statistics, request_data, filename=None):
         """Генерация Excel отчета"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"fruit_report_{timestamp}.xlsx"
+        import pandas as pd
+        
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"fruit_report_{timestamp}.xlsx"
         filepath = os.path.join(self.output_dir, filename)
         
         # Создаем DataFrame с основной статистикой
@@ -90,7 +122,7 @@ class ReportGenerator:
         df_fruits = pd.DataFrame(fruit_data, columns=['Фрукт', 'Количество'])
         
         # Создаем Excel writer
-        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+        with tracer.stage('report_excel'), pd.ExcelWriter(filepath, engine='openpyxl') as writer:
             df_main.to_excel(writer, sheet_name='Общая статистика', index=False)
             df_fruits.to_excel(writer, sheet_name='Статистика по фруктам', index=False)
             
@@ -105,25 +137,112 @@ class ReportGenerator:
         
         return filepath
     
-    def generate_history_report(self, history_data):
-        """Генерация отчета по истории запросов"""
+    def generate_history_report(self, history_data, report_format='xlsx'):
+        """
+        Генерация отчета по истории запросов.
+        history_data - итерируемый источник запросов (например, курсор БД):
+        строки записываются в файл по мере чтения, память не зависит от объема истории
+        """
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"history_report_{timestamp}.xlsx"
+        filename = f"history_report_{timestamp}.{report_format}"
         filepath = os.path.join(self.output_dir, filename)
         
-        # Конвертируем историю в DataFrame
-        data = []
-        for item in history_data:
-            data.append({
-                'Дата и время': item['timestamp'],
-                'Файл': item['filename'],
-                'Всего фруктов': item['total_fruits'],
-                'Время обработки (сек)': item['processing_time']
-            })
-        
-        df = pd.DataFrame(data)
-        
-        # Сохраняем в Excel
-        df.to_excel(filepath, index=False)
+        with tracer.stage('report_history'):
+            self._write_history(history_data, filepath, report_format)
         
         return filepath
+    
+    def stream_history_report(self, history_data, report_format='xlsx', chunk_size=64 * 1024):
+        """
+        Потоковая генерация отчета по истории: генератор байтовых фрагментов
+        для отдачи по HTTP без сохранения файла в static/results
+        """
+        if report_format == 'csv':
+            # CSV формируется и отдается построчно
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            # BOM, чтобы Excel правильно определил кодировку
+            buffer.write('\ufeff')
+            writer.writerow([title for title, _ in HISTORY_COLUMNS])
+            
+            for item in history_data:
+                writer.writerow([item[field] for _, field in HISTORY_COLUMNS])
+                if buffer.tell() >= chunk_size:
+                    yield buffer.getvalue().encode('utf-8')
+                    buffer.seek(0)
+                    buffer.truncate()
+            
+            yield buffer.getvalue().encode('utf-8')
+            return
+        
+        # XLSX и Parquet - архивные форматы: пишем во временный файл и отдаем его частями
+        fd, temp_path = tempfile.mkstemp(suffix=f'.{report_format}')
+        os.close(fd)
+        try:
+            self._write_history(history_data, temp_path, report_format)
+            with open(temp_path, 'rb') as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            os.remove(temp_path)
+    
+    def _write_history(self, history_data, filepath, report_format, chunk_size=10000):
+        """Инкрементальная запись истории в файл указанного формата"""
+        headers = [title for title, _ in HISTORY_COLUMNS]
+        
+        if report_format == 'xlsx':
+            from openpyxl import Workbook
+            
+            # write_only: строки сразу сбрасываются на диск, а не копятся в памяти
+            workbook = Workbook(write_only=True)
+            worksheet = workbook.create_sheet('История')
+            worksheet.append(headers)
+            for item in history_data:
+                worksheet.append([item[field] for _, field in HISTORY_COLUMNS])
+            workbook.save(filepath)
+            
+        elif report_format == 'csv':
+            with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
+                writer = csv.writer(f)
+                writer.writerow(headers)
+                for item in history_data:
+                    writer.writerow([item[field] for _, field in HISTORY_COLUMNS])
+                    
+        elif report_format == 'parquet':
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise RuntimeError('Parquet export requires pyarrow')
+            
+            schema = pa.schema([
+                (headers[0], pa.string()),
+                (headers[1], pa.string()),
+                (headers[2], pa.int64()),
+                (headers[3], pa.float64())
+            ])
+            
+            # Каждая порция строк - отдельная row group
+            with pq.ParquetWriter(filepath, schema) as writer:
+                chunk = []
+                for item in history_data:
+                    chunk.append(item)
+                    if len(chunk) >= chunk_size:
+                        writer.write_table(self._history_table(pa, schema, chunk))
+                        chunk = []
+                if chunk:
+                    writer.write_table(self._history_table(pa, schema, chunk))
+                    
+        else:
+            raise ValueError(f'Unsupported report format: {report_format}')
+    
+    @staticmethod
+    def _history_table(pa, schema, chunk):
+        """Порция истории в виде таблицы Arrow"""
+        columns = [[item[field] for item in chunk] for _, field in HISTORY_COLUMNS]
+        return pa.Table.from_arrays([pa.array(column, type=schema.field(i).type)
+                                     for i, column in enumerate(columns)],
+                                    schema=schema)
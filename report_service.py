@@ -0,0 +1,111 @@
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Поддерживаемые форматы отчета по запросу: тип -> расширение файла
+REPORT_FORMATS = {
+    'pdf': 'pdf',
+    'excel': 'xlsx'
+}
+
+
+class ReportService:
+    """
+    Фоновая генерация отчетов по запросам в пуле потоков.
+
+    Отчет однозначно определяется парой (request_id, формат): записи
+    в истории не меняются, поэтому готовый файл переиспользуется,
+    а одновременные запросы одного отчета ждут одну и ту же задачу
+    """
+
+    def __init__(self, report_gen, workers=2):
+        self.report_gen = report_gen
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='report')
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def report_path(self, request_id, report_format):
+        """Путь к файлу отчета для пары (request_id, формат)"""
+        filename = f"fruit_report_{request_id}.{REPORT_FORMATS[report_format]}"
+        return os.path.join(self.report_gen.output_dir, filename)
+
+    def request_report(self, request_data, report_format):
+        """
+        Получение отчета: Future с путем к файлу.
+        Готовый отчет возвращается сразу, иначе генерация ставится в очередь
+        """
+        if report_format not in REPORT_FORMATS:
+            raise ValueError(f'Unsupported report format: {report_format}')
+
+        key = (request_data['id'], report_format)
+        path = self.report_path(*key)
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+
+            if os.path.exists(path):
+                self.hits += 1
+                future = Future()
+                future.set_result(path)
+                return future
+
+            self.misses += 1
+            future = self._executor.submit(self._render, request_data, report_format, path)
+            self._in_flight[key] = future
+
+        future.add_done_callback(lambda f: self._done(key))
+        return future
+
+    def get_status(self, request_id, report_format):
+        """Состояние отчета: 'ready', 'pending' или None (не запрашивался)"""
+        key = (request_id, report_format)
+        with self._lock:
+            if key in self._in_flight:
+                return 'pending'
+        return 'ready' if os.path.exists(self.report_path(*key)) else None
+
+    def _done(self, key):
+        """Удаление завершенной задачи из списка выполняемых"""
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _render(self, request_data, report_format, path):
+        """Генерация отчета во временный файл и атомарная замена"""
+        statistics = {
+            'total_fruits': request_data['total_fruits'],
+            'fruit_counts': request_data['fruit_counts']
+        }
+
+        # Уникальное временное имя: частично записанный файл никогда не отдается клиенту
+        name, extension = os.path.splitext(os.path.basename(path))
+        temp_filename = f"{name}.{uuid.uuid4().hex[:8]}.tmp{extension}"
+
+        if report_format == 'pdf':
+            temp_path = self.report_gen.generate_pdf_report(statistics, request_data,
+                                                            filename=temp_filename)
+        else:
+            temp_path = self.report_gen.generate_excel_report(statistics, request_data,
+                                                              filename=temp_filename)
+
+        os.replace(temp_path, path)
+        return path
+
+    def stats(self):
+        """Счетчики переиспользования отчетов"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'in_flight': len(self._in_flight)
+            }
+
+    def shutdown(self):
+        """Остановка пула"""
+        self._executor.shutdown(wait=True)
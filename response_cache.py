@@ -0,0 +1,132 @@
+import functools
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Response, current_app, request
+
+# Заголовки, которые формируются заново для каждого ответа из кэша
+_SKIP_HEADERS = {'content-length', 'content-type', 'content-encoding', 'etag',
+                 'last-modified', 'cache-control', 'vary'}
+
+
+class _Entry:
+    """Готовый ответ для одной версии данных"""
+
+    def __init__(self, version, last_modified, body, mimetype, headers):
+        self.version = version
+        self.last_modified = last_modified
+        self.body = body
+        self.mimetype = mimetype
+        self.headers = headers
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.gzipped = None
+
+
+class ResponseCache:
+    """
+    Кэш ответов GET-эндпоинтов, которые читают только историю запросов.
+
+    version_fn() возвращает (версию данных, время последнего изменения);
+    пока версия не изменилась (в БД не появился новый запрос), ответ
+    отдается из памяти без запросов к базе и сериализации. Клиент получает
+    ETag и Last-Modified и при повторном запросе - 304 Not Modified;
+    при Accept-Encoding: gzip тело сжимается один раз на версию.
+    Ключ - путь с параметрами запроса, записи вытесняются по LRU
+    """
+
+    def __init__(self, version_fn, max_entries=256, gzip_min_bytes=500, enabled=True):
+        self.version_fn = version_fn
+        self.max_entries = max_entries
+        self.gzip_min_bytes = gzip_min_bytes
+        self.enabled = enabled
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def cached(self, view):
+        """Декоратор view-функции"""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return view(*args, **kwargs)
+
+            # Версия читается до вызова view: запись, пришедшая во время
+            # вызова, сменит версию, и следующий запрос пересчитает ответ
+            version, last_modified = self.version_fn()
+            key = request.full_path
+
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.version == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                else:
+                    entry = None
+
+            if entry is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+
+                headers = [(name, value) for name, value in response.headers
+                           if name.lower() not in _SKIP_HEADERS]
+                entry = _Entry(version, last_modified, response.get_data(),
+                               response.mimetype, headers)
+                with self._lock:
+                    self.misses += 1
+                    self._entries[key] = entry
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+
+            return self._respond(entry)
+
+        return wrapper
+
+    def _respond(self, entry):
+        """Ответ из записи кэша: 304, сжатое или обычное тело"""
+        use_gzip = len(entry.body) >= self.gzip_min_bytes and \
+            'gzip' in request.headers.get('Accept-Encoding', '')
+
+        if use_gzip:
+            if entry.gzipped is None:
+                # Гонка двух потоков здесь безвредна: оба сожмут одно и то же
+                entry.gzipped = gzip.compress(entry.body, compresslevel=6)
+            body, etag = entry.gzipped, f'{entry.etag}-gz'
+        else:
+            body, etag = entry.body, entry.etag
+
+        response = Response(body, mimetype=entry.mimetype, headers=entry.headers)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        if entry.last_modified:
+            response.last_modified = datetime.strptime(
+                entry.last_modified, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+        # Браузер хранит ответ, но перепроверяет его при каждом запросе
+        response.cache_control.no_cache = True
+
+        response.make_conditional(request)
+        if response.status_code == 304:
+            with self._lock:
+                self.not_modified += 1
+        return response
+
+    def stats(self):
+        """Счетчики попаданий, промахов и ответов 304"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified
+            }
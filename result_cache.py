@@ -0,0 +1,185 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Кэш результатов детекции по хэшу содержимого изображения.
+
+    Первый уровень - LRU в памяти, второй (необязательный) - таблица
+    SQLite, которая переживает перезапуск приложения.
+    Записи вытесняются по количеству (max_entries / max_db_entries)
+    и по времени жизни (ttl, секунды)
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, db_path=None,
+                 max_db_entries=100000, purge_interval=256):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_db_entries = max_db_entries
+        self.purge_interval = purge_interval
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.db_hits = 0
+
+        if self.db_path:
+            self._init_db()
+
+    @staticmethod
+    def make_key(data, fingerprint):
+        """Ключ кэша: хэш байтов изображения плюс отпечаток конфигурации модели"""
+        digest = hashlib.sha256(data).hexdigest()
+        return f"{digest}:{fingerprint}"
+
+    def _init_db(self):
+        """Создание таблицы постоянного уровня кэша"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS result_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                created_at REAL,
+                expires_at REAL
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_result_cache_created
+            ON result_cache (created_at)
+        ''')
+
+        conn.commit()
+        conn.close()
+
+    def get(self, key, validate=None):
+        """
+        Получение значения из кэша или None.
+        validate(value) - проверка записи (например, что ее файлы еще на диске):
+        непрошедшая проверку запись удаляется и считается промахом
+        """
+        now = time.time()
+        value = None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    value = entry[1]
+                else:
+                    del self._entries[key]
+
+        from_db = False
+        if value is None and self.db_path:
+            value = self._db_get(key, now)
+            from_db = value is not None
+
+        if value is not None and validate is not None and not validate(value):
+            self.invalidate(key)
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            if from_db:
+                # Поднимаем запись из SQLite в память
+                self.db_hits += 1
+                self._store(key, value, now + self.ttl)
+            return value
+
+    def put(self, key, value):
+        """Сохранение значения в кэш"""
+        now = time.time()
+
+        with self._lock:
+            self._store(key, value, now + self.ttl)
+            self._puts += 1
+            purge = self._puts % self.purge_interval == 0
+
+        if self.db_path:
+            self._db_put(key, value, now, purge)
+
+    def invalidate(self, key):
+        """Удаление записи из кэша"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+        if self.db_path:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('DELETE FROM result_cache WHERE key = ?', (key,))
+            conn.commit()
+            conn.close()
+
+    def _store(self, key, value, expires_at):
+        """Запись в LRU с вытеснением самых старых (вызывается под блокировкой)"""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _db_get(self, key, now):
+        """Чтение из постоянного уровня"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT value, expires_at FROM result_cache WHERE key = ?', (key,))
+        row = cursor.fetchone()
+
+        conn.close()
+
+        if row is None or row[1] <= now:
+            return None
+        return json.loads(row[0])
+
+    def _db_put(self, key, value, now, purge=False):
+        """Запись в постоянный уровень, периодически с очисткой"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT OR REPLACE INTO result_cache (key, value, created_at, expires_at)
+            VALUES (?, ?, ?, ?)
+        ''', (key, json.dumps(value), now, now + self.ttl))
+
+        if purge:
+            # Удаляем просроченные записи и самые старые сверх лимита
+            cursor.execute('DELETE FROM result_cache WHERE expires_at <= ?', (now,))
+            cursor.execute('''
+                DELETE FROM result_cache WHERE key IN (
+                    SELECT key FROM result_cache
+                    ORDER BY created_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_db_entries,))
+
+        conn.commit()
+        conn.close()
+
+    def stats(self):
+        """Счетчики попаданий и промахов"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'db_hits': self.db_hits,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'persistent': bool(self.db_path)
+            }
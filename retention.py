@@ -0,0 +1,155 @@
+import heapq
+import os
+import threading
+import time
+
+
+class RetentionManager:
+    """
+    Хранение файлов (загрузки, результаты, отчеты) с ограничением
+    по возрасту и по суммарному размеру.
+
+    Файлы регистрируются через track в индексе в памяти (куча по времени
+    истечения), поэтому запросы не сканируют каталоги. Удаление выполняет
+    фоновый поток раз в interval секунд; при старте он один раз
+    индексирует уже лежащие в folders файлы по времени изменения.
+    max_total_bytes=0 - без ограничения размера.
+
+    Индекс и квота относятся к одному процессу. Поток не переживает fork:
+    рабочий процесс веб-сервера вызывает restart_after_fork (gunicorn.conf.py),
+    а дочерние процессы пула задач файлы не удаляют
+    """
+
+    def __init__(self, folders=(), max_age_hours=24, max_total_bytes=0, interval=60):
+        self.folders = list(folders)
+        self.max_age = max_age_hours * 3600
+        self.max_total_bytes = max_total_bytes
+        self.interval = interval
+
+        # path -> (expires_at, size); в куче могут быть устаревшие записи,
+        # актуальность проверяется по словарю
+        self._entries = {}
+        self._heap = []
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self.evicted = 0
+        self.evicted_bytes = 0
+
+        self._start(scan=True)
+
+    def _start(self, scan=False):
+        """Запуск потока очистки"""
+        self._thread = threading.Thread(target=self._run, args=(scan,),
+                                        name='retention', daemon=True)
+        self._thread.start()
+
+    def restart_after_fork(self):
+        """Запуск потока очистки в процессе, созданном через fork"""
+        if not self._stop.is_set():
+            self._lock = threading.Lock()
+            self._start()
+
+    def track(self, path, size=None, created=None):
+        """Регистрация файла (повторная регистрация продлевает срок хранения)"""
+        if not path:
+            return
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return
+        expires_at = (created if created is not None else time.time()) + self.max_age
+
+        with self._lock:
+            previous = self._entries.get(path)
+            if previous is not None:
+                self._total_bytes -= previous[1]
+            self._entries[path] = (expires_at, size)
+            self._total_bytes += size
+            heapq.heappush(self._heap, (expires_at, path))
+
+    def untrack(self, path):
+        """Исключение файла из индекса (файл не удаляется)"""
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._total_bytes -= entry[1]
+
+    def evict(self, now=None):
+        """
+        Один проход очистки: просроченные файлы, затем самые старые,
+        пока суммарный размер больше квоты. Возвращает число удаленных файлов
+        """
+        now = time.time() if now is None else now
+        victims = []
+
+        with self._lock:
+            while self._heap:
+                expires_at, path = self._heap[0]
+                entry = self._entries.get(path)
+                if entry is None or entry[0] != expires_at:
+                    # Устаревшая запись кучи (файл исключен или продлен)
+                    heapq.heappop(self._heap)
+                    continue
+                over_quota = self.max_total_bytes and self._total_bytes > self.max_total_bytes
+                if expires_at > now and not over_quota:
+                    break
+                heapq.heappop(self._heap)
+                del self._entries[path]
+                self._total_bytes -= entry[1]
+                victims.append((path, entry[1]))
+
+        # Файлы удаляются вне блокировки
+        removed = 0
+        for path, size in victims:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Ошибка при удалении файла {path}: {str(e)}")
+                continue
+            removed += 1
+            self.evicted_bytes += size
+        self.evicted += removed
+        return removed
+
+    def _scan(self):
+        """Индексация файлов, оставшихся с прошлых запусков"""
+        for folder in self.folders:
+            if not os.path.isdir(folder):
+                continue
+            for entry in os.scandir(folder):
+                if entry.is_file():
+                    stat = entry.stat()
+                    self.track(entry.path, stat.st_size, stat.st_mtime)
+
+    def _run(self, scan):
+        """Основной цикл потока очистки"""
+        if scan:
+            try:
+                self._scan()
+            except OSError as e:
+                print(f"Ошибка при индексации файлов: {str(e)}")
+        self.evict()
+        while not self._stop.wait(self.interval):
+            self.evict()
+
+    def stats(self):
+        """Состояние индекса и счетчики удалений"""
+        with self._lock:
+            return {
+                'files': len(self._entries),
+                'total_bytes': self._total_bytes,
+                'max_total_bytes': self.max_total_bytes,
+                'max_age_hours': self.max_age / 3600,
+                'evicted': self.evicted,
+                'evicted_bytes': self.evicted_bytes
+            }
+
+    def close(self):
+        """Остановка потока очистки"""
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,187 @@
+import threading
+import time
+import uuid
+
+from batching import BatchScheduler
+from tracker import FruitTracker
+from video_pipeline import FrameReader
+
+
+class VideoStream:
+    """
+    Один видеоисточник (файл, камера, RTSP): кадры декодируются в своем
+    потоке, а инференс идет через общий для всех потоков планировщик.
+
+    В работе у потока не больше одного кадра. Для живых источников
+    (камера, URL потока или файл с realtime=True) новые кадры вытесняют
+    старые в очереди чтения (drop_stale): при перегрузке отбрасываются
+    устаревшие кадры, а не растет задержка. Файл без realtime читается
+    со скоростью инференса без потери кадров.
+    sampler (MotionSampler) пропускает кадры без движения до инференса
+    """
+
+    def __init__(self, stream_id, source, scheduler, frame_interval=1, queue_size=2,
+                 realtime=False, count_line=None, count_axis='y', sampler=None):
+        self.stream_id = stream_id
+        self.source = source
+        self.scheduler = scheduler
+        self.sampler = sampler
+
+        live = realtime or isinstance(source, int) or '://' in str(source)
+        self.reader = FrameReader(source, frame_interval, queue_size,
+                                  drop_stale=live, realtime=realtime, sampler=sampler)
+        self.tracker = FruitTracker(count_line=count_line, count_axis=count_axis)
+
+        self.status = 'starting'
+        self.error = None
+        self.frames_processed = 0
+        self.current_counts = {}
+        self.started = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Запуск чтения и обработки кадров"""
+        self.reader.start()
+        self._thread = threading.Thread(target=self._run,
+                                        name=f'stream-{self.stream_id}',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        """Цикл потребителя: свежий кадр -> общий планировщик -> трекер"""
+        self.status = 'running'
+        try:
+            for _, frame in self.reader:
+                statistics = self.scheduler.submit(frame).result()
+                detections = statistics['detections']
+                with self._lock:
+                    self.tracker.update(detections['bbox'], detections['fruit'])
+                    self.current_counts = statistics['fruit_counts']
+                    self.frames_processed += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            self.reader.stop()
+            self.finished = time.time()
+            if self.error is None:
+                self.error = self.reader.error
+
+            if self.error is not None:
+                print(f"Ошибка видеопотока {self.stream_id}: {str(self.error)}")
+                self.status = 'failed'
+            elif self.status != 'stopped':
+                self.status = 'finished'
+
+    def stop(self):
+        """Остановка потока"""
+        self.status = 'stopped'
+        self.reader.stop()
+        if self._thread is not None:
+            self._thread.join()
+
+    def snapshot(self):
+        """Текущее состояние и накопленные счетчики"""
+        with self._lock:
+            unique_counts = dict(self.tracker.unique_counts)
+            current_counts = dict(self.current_counts)
+            frames_processed = self.frames_processed
+
+        elapsed = (self.finished or time.time()) - self.started
+        return {
+            'id': self.stream_id,
+            'source': self.source,
+            'status': self.status,
+            'error': str(self.error) if self.error is not None else None,
+            'fruit_counts': unique_counts,
+            'total_fruits': sum(unique_counts.values()),
+            'current_counts': current_counts,
+            'tracks': self.tracker.total_tracks,
+            'frames_read': self.reader.frames_read,
+            'frames_processed': frames_processed,
+            # Счетчики выбора кадров: в модель дошли frames_inferred, sampler
+            # пропустил frames_skipped, выбранные, но устаревшие кадры
+            # вытеснены из очереди (frames_dropped)
+            'frames_inferred': frames_processed,
+            'frames_skipped': self.sampler.frames_skipped if self.sampler is not None else 0,
+            'frames_dropped': self.reader.frames_dropped,
+            'fps': round(frames_processed / elapsed, 2) if elapsed > 0 else 0.0,
+            'started': self.started,
+            'finished': self.finished
+        }
+
+
+class StreamManager:
+    """
+    Одновременная обработка нескольких видеоисточников.
+
+    Все потоки отдают кадры в один BatchScheduler: кадры разных камер
+    собираются в общий батч, поэтому пропускная способность определяется
+    одним батчевым инференсом, а не числом потоков или воркеров Flask.
+    detect_fn(frames) возвращает статистику для каждого кадра;
+    workers батчей обрабатываются параллельно (по числу реплик модели)
+    """
+
+    def __init__(self, detect_fn, max_streams=8, max_batch_size=8, max_wait_ms=10,
+                 workers=1):
+        self.max_streams = max_streams
+        self.scheduler = BatchScheduler(detect_fn, max_batch_size=max_batch_size,
+                                        max_wait_ms=max_wait_ms, name='streams',
+                                        workers=workers)
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def add(self, source, frame_interval=1, realtime=False, count_line=None,
+            count_axis='y', sampler=None):
+        """Запуск нового потока, возвращает его ID"""
+        with self._lock:
+            active = sum(1 for stream in self._streams.values()
+                         if stream.status in ('starting', 'running'))
+            if active >= self.max_streams:
+                raise RuntimeError('Too many active streams')
+
+            stream_id = uuid.uuid4().hex[:12]
+            stream = VideoStream(stream_id, source, self.scheduler,
+                                 frame_interval=frame_interval, realtime=realtime,
+                                 count_line=count_line, count_axis=count_axis,
+                                 sampler=sampler)
+            self._streams[stream_id] = stream
+
+        stream.start()
+        return stream_id
+
+    def get(self, stream_id):
+        """Состояние потока или None"""
+        with self._lock:
+            stream = self._streams.get(stream_id)
+        return stream.snapshot() if stream is not None else None
+
+    def list(self):
+        """Состояние всех потоков"""
+        with self._lock:
+            streams = list(self._streams.values())
+        return [stream.snapshot() for stream in streams]
+
+    def remove(self, stream_id):
+        """Остановка и удаление потока, возвращает его последнее состояние"""
+        with self._lock:
+            stream = self._streams.pop(stream_id, None)
+        if stream is None:
+            return None
+        stream.stop()
+        return stream.snapshot()
+
+    def stats(self):
+        """Статистика общего планировщика"""
+        return self.scheduler.stats()
+
+    def shutdown(self):
+        """Остановка всех потоков и планировщика"""
+        with self._lock:
+            streams = list(self._streams.values())
+            self._streams.clear()
+        for stream in streams:
+            stream.stop()
+        self.scheduler.close()
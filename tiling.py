@@ -0,0 +1,93 @@
+import numpy as np
+
+
+def make_tiles(height, width, tile_size=640, overlap=0.2):
+    """
+    Разбиение изображения на перекрывающиеся плитки.
+    Возвращает список (x1, y1, x2, y2); последние плитки в ряду
+    прижимаются к краю изображения, поэтому все плитки одного размера
+    """
+    stride = max(1, int(tile_size * (1.0 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height)
+            for x in starts(width)]
+
+
+def _overlap_ratios(box, boxes, metric):
+    """Перекрытие одной рамки с набором рамок: IoU или пересечение к меньшей (IoS)"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == 'ios':
+        denominator = np.minimum(area, areas)
+    else:
+        denominator = area + areas - intersection
+    return intersection / np.maximum(denominator, 1e-9)
+
+
+def cut_by_tile_edge(boxes, tile, height, width, margin=2):
+    """
+    Рамки, упирающиеся во внутреннюю границу плитки (шов с соседней плиткой):
+    фрукт на таких рамках может быть обрезан. Края изображения швом не считаются
+    """
+    x1, y1, x2, y2 = tile
+    cut = np.zeros(len(boxes), dtype=bool)
+    if x1 > 0:
+        cut |= boxes[:, 0] <= x1 + margin
+    if y1 > 0:
+        cut |= boxes[:, 1] <= y1 + margin
+    if x2 < width:
+        cut |= boxes[:, 2] >= x2 - margin
+    if y2 < height:
+        cut |= boxes[:, 3] >= y2 - margin
+    return cut
+
+
+def merge_detections(xyxy, confidences, class_ids, threshold=0.5, iou_threshold=0.5,
+                     sources=None, cut=None):
+    """
+    Глобальное подавление дублей (NMS) по классам после склейки плиток.
+
+    Для всех пар рамок - классический NMS по IoU (iou_threshold): соседние
+    фрукты, которые модель оставила как разные объекты, не сливаются.
+    Пересечение, деленное на площадь меньшей рамки (IoS, threshold),
+    применяется только к парам из разных источников (sources - номер плитки
+    каждой рамки), если хотя бы одна рамка обрезана швом плитки (cut):
+    так обрезанная часть фрукта объединяется с его целой рамкой.
+    Возвращает индексы оставленных рамок по убыванию уверенности
+    """
+    if len(confidences) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    keep = []
+    for class_id in np.unique(class_ids):
+        indices = np.flatnonzero(class_ids == class_id)
+        indices = indices[np.argsort(-confidences[indices], kind='stable')]
+        while len(indices):
+            best = indices[0]
+            keep.append(best)
+            if len(indices) == 1:
+                break
+            rest = indices[1:]
+            suppress = _overlap_ratios(xyxy[best], xyxy[rest], 'iou') > iou_threshold
+            if sources is not None and cut is not None:
+                seam = (sources[rest] != sources[best]) & (cut[rest] | cut[best])
+                if seam.any():
+                    suppress |= seam & (_overlap_ratios(xyxy[best], xyxy[rest], 'ios') > threshold)
+            indices = rest[~suppress]
+
+    keep = np.array(keep, dtype=np.int64)
+    return keep[np.argsort(-confidences[keep], kind='stable')]
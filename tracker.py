@@ -0,0 +1,173 @@
+from collections import defaultdict
+
+import numpy as np
+
+
+class Track:
+    """Один отслеживаемый фрукт"""
+
+    def __init__(self, track_id, fruit, bbox):
+        self.track_id = track_id
+        self.fruit = fruit
+        self.bbox = bbox
+        self.centroid = _centroid(bbox)
+        self.hits = 1
+        self.missed = 0
+        self.counted = False
+
+    def update(self, bbox):
+        """Обновление позиции трека новой детекцией"""
+        previous = self.centroid
+        self.bbox = bbox
+        self.centroid = _centroid(bbox)
+        self.hits += 1
+        self.missed = 0
+        return previous
+
+
+def _centroid(bbox):
+    """Центр ограничивающего прямоугольника"""
+    x1, y1, x2, y2 = bbox
+    return ((x1 + x2) / 2.0, (y1 + y2) / 2.0)
+
+
+def _iou(a, b):
+    """IoU двух прямоугольников в формате [x1, y1, x2, y2]"""
+    ix1 = max(a[0], b[0])
+    iy1 = max(a[1], b[1])
+    ix2 = min(a[2], b[2])
+    iy2 = min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    if inter <= 0:
+        return 0.0
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class FruitTracker:
+    """
+    Трекер фруктов на конвейере: сопоставляет детекции соседних кадров
+    по IoU (с запасным сопоставлением по расстоянию между центрами),
+    присваивает каждому фрукту ID и считает уникальные фрукты.
+
+    Кандидаты для сопоставления ищутся через пространственную сетку
+    (только соседние ячейки), поэтому стоимость кадра растет линейно
+    с количеством детекций.
+
+    Если задана count_line, фрукт засчитывается при пересечении линии
+    (координата по оси count_axis), иначе - после min_hits подтверждений.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_distance=50.0, max_missed=5,
+                 min_hits=2, count_line=None, count_axis='y'):
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.min_hits = min_hits
+        self.count_line = count_line
+        self._axis = 0 if count_axis == 'x' else 1
+
+        self.tracks = {}
+        self.unique_counts = {}
+        self._next_id = 1
+
+    def _grid(self, tracks, cell_size):
+        """Раскладка треков по ячейкам пространственной сетки"""
+        grid = defaultdict(list)
+        for track in tracks:
+            cx, cy = track.centroid
+            grid[(int(cx // cell_size), int(cy // cell_size))].append(track)
+        return grid
+
+    def _count(self, track, previous_centroid=None):
+        """Учет фрукта в уникальных счетчиках (один раз на трек)"""
+        if track.counted:
+            return
+
+        if self.count_line is None:
+            if track.hits < self.min_hits:
+                return
+        else:
+            if previous_centroid is None:
+                return
+            before = previous_centroid[self._axis] - self.count_line
+            after = track.centroid[self._axis] - self.count_line
+            # Засчитываем только пересечение линии (смена стороны)
+            if before * after > 0 or before == after:
+                return
+
+        track.counted = True
+        self.unique_counts[track.fruit] = self.unique_counts.get(track.fruit, 0) + 1
+
+    def update(self, boxes, fruits):
+        """
+        Обработка детекций очередного кадра.
+        boxes - массив Nx4 [x1, y1, x2, y2], fruits - названия фруктов.
+        Возвращает список ID треков в порядке детекций
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        active = list(self.tracks.values())
+
+        # Размер ячейки не меньше самого крупного объекта и радиуса поиска:
+        # тогда пересекающиеся или близкие объекты лежат в соседних ячейках
+        cell_size = self.max_distance or 1.0
+        if len(boxes):
+            cell_size = max(cell_size, float(np.max(boxes[:, 2:] - boxes[:, :2])))
+        for track in active:
+            x1, y1, x2, y2 = track.bbox
+            cell_size = max(cell_size, x2 - x1, y2 - y1)
+        grid = self._grid(active, cell_size)
+
+        # Кандидатные пары (оценка, номер детекции, трек)
+        candidates = []
+        for index, (bbox, fruit) in enumerate(zip(boxes.tolist(), fruits)):
+            cx, cy = _centroid(bbox)
+            gx, gy = int(cx // cell_size), int(cy // cell_size)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for track in grid.get((gx + dx, gy + dy), ()):
+                        if track.fruit != fruit:
+                            continue
+                        iou = _iou(bbox, track.bbox)
+                        if iou >= self.iou_threshold:
+                            candidates.append((1.0 + iou, index, track))
+                            continue
+                        distance = np.hypot(cx - track.centroid[0], cy - track.centroid[1])
+                        if self.max_distance and distance <= self.max_distance:
+                            # Сопоставление по центрам всегда слабее сопоставления по IoU
+                            candidates.append((1.0 - distance / (self.max_distance + 1.0), index, track))
+
+        # Жадное сопоставление: сначала лучшие пары
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        assigned = [None] * len(boxes)
+        matched_tracks = set()
+        for _, index, track in candidates:
+            if assigned[index] is not None or track.track_id in matched_tracks:
+                continue
+            assigned[index] = track.track_id
+            matched_tracks.add(track.track_id)
+            previous = track.update(boxes[index].tolist())
+            self._count(track, previous)
+
+        # Новые треки для несопоставленных детекций
+        for index, (bbox, fruit) in enumerate(zip(boxes.tolist(), fruits)):
+            if assigned[index] is None:
+                track = Track(self._next_id, fruit, bbox)
+                self._next_id += 1
+                self.tracks[track.track_id] = track
+                assigned[index] = track.track_id
+                self._count(track)
+
+        # Удаляем треки, которые давно не подтверждались
+        for track in active:
+            if track.track_id not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    del self.tracks[track.track_id]
+
+        return assigned
+
+    @property
+    def total_tracks(self):
+        """Сколько ID было выдано за все время"""
+        return self._next_id - 1
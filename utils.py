@@ -1,7 +1,11 @@
 import os
+import uuid
+from urllib.parse import urlsplit
 from werkzeug.utils import secure_filename
 from datetime import datetime
 
+from metrics import tracer
+
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
 
 def allowed_file(filename):
@@ -9,36 +13,47 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def save_uploaded_file(file, upload_folder):
-    """Сохранение загруженного файла"""
-    if file and allowed_file(file.filename):
-        # Создаем уникальное имя файла
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = secure_filename(f"{timestamp}_{file.filename}")
-        filepath = os.path.join(upload_folder, filename)
-        
-        # Сохраняем файл
-        file.save(filepath)
-        return filepath
-    
-    return None
+def allowed_stream_source(source, allowed_sources):
+    """
+    Проверка источника видеопотока по списку разрешенных: номер камеры,
+    файл или каталог (любой файл внутри него), URL потока (схема и хост,
+    например rtsp://camera1; порт проверяется, если указан)
+    """
+    source = str(source)
+    for allowed in allowed_sources:
+        if '://' in allowed:
+            if '://' not in source:
+                continue
+            allowed_url, source_url = urlsplit(allowed), urlsplit(source)
+            if source_url.scheme.lower() == allowed_url.scheme.lower() and \
+               source_url.hostname == allowed_url.hostname and \
+               allowed_url.port in (None, source_url.port):
+                return True
+        elif allowed.isdigit():
+            if source == allowed:
+                return True
+        elif '://' not in source and not source.isdigit():
+            # Путь нормализуется: ../ и символические ссылки не выводят из каталога
+            root = os.path.realpath(allowed)
+            path = os.path.realpath(source)
+            if os.path.commonpath([root, path]) == root:
+                return True
+    return False
 
-def cleanup_old_files(folder, max_age_hours=24):
-    """Очистка старых файлов"""
-    if not os.path.exists(folder):
-        return
-    
-    current_time = datetime.now().timestamp()
-    
-    for filename in os.listdir(folder):
-        filepath = os.path.join(folder, filename)
-        if os.path.isfile(filepath):
-            file_age = current_time - os.path.getmtime(filepath)
-            if file_age > max_age_hours * 3600:  # Конвертируем часы в секунды
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
+def make_upload_filename(filename):
+    """
+    Уникальное безопасное имя для загруженного файла: одноименные загрузки
+    в одну и ту же секунду не перезаписывают друг друга
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return secure_filename(f"{timestamp}_{uuid.uuid4().hex[:12]}_{filename}")
+
+def save_upload_data(data, filepath):
+    """Запись уже прочитанного в память загруженного файла"""
+    with tracer.stage('save_upload'):
+        with open(filepath, 'wb') as f:
+            f.write(data)
+    return filepath
 
 def format_statistics(statistics):
     """Форматирование статистики для отображения"""
@@ -48,7 +63,7 @@ def format_statistics(statistics):
     formatted = {
         'total': statistics['total_fruits'],
         'by_fruit': statistics['fruit_counts'],
-        'detections': len(statistics.get('detections', [])),
+        'detections': len(statistics.get('detections', {}).get('fruit', [])),
         'result_image': statistics.get('result_image', '')
     }
     
@@ -0,0 +1,207 @@
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+def _changed_fraction(a, b, pixel_threshold):
+    """Доля пикселей двух миниатюр, яркость которых отличается больше порога"""
+    return np.count_nonzero(cv2.absdiff(a, b) > pixel_threshold) / a.size
+
+
+class MotionSampler:
+    """
+    Адаптивный выбор кадров для инференса по движению в кадре.
+
+    Для каждого кадра считается дешевая оценка движения: доля пикселей
+    уменьшенной (до size пикселей по большей стороне) серой копии, яркость
+    которых изменилась с предыдущего кадра больше чем на pixel_threshold.
+    Доля, а не средняя разница: небольшой фрукт на большом кадре почти
+    не меняет среднюю яркость. При движении (доля не меньше threshold)
+    шаг между кадрами для модели уменьшается вдвое (до min_interval),
+    в покое - растет вдвое (до max_interval). Кадр пропускается, если
+    с последнего отправленного в модель кадра сцена не изменилась;
+    раз в max_interval кадров инференс выполняется в любом случае
+    """
+
+    def __init__(self, min_interval=1, max_interval=30, threshold=0.002,
+                 pixel_threshold=15, size=160):
+        self.min_interval = max(1, int(min_interval))
+        self.max_interval = max(self.min_interval, int(max_interval))
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.size = size
+
+        self.interval = self.max_interval
+        self.frames_inferred = 0
+        self.frames_skipped = 0
+        self.last_score = 0.0
+
+        self._previous = None
+        # Миниатюра последнего кадра, отправленного в модель
+        self._reference = None
+        self._since_inference = 0
+
+    def _thumbnail(self, frame):
+        """Уменьшенная серая копия кадра"""
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.size / max(height, width))
+        small = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def should_infer(self, frame):
+        """Нужно ли отправлять кадр в модель"""
+        small = self._thumbnail(frame)
+        self._since_inference += 1
+
+        if self._reference is None:
+            infer = True
+        else:
+            self.last_score = _changed_fraction(small, self._previous, self.pixel_threshold)
+            if self.last_score >= self.threshold:
+                self.interval = max(self.min_interval, self.interval // 2)
+            else:
+                self.interval = min(self.max_interval, self.interval * 2)
+
+            changed = _changed_fraction(small, self._reference,
+                                        self.pixel_threshold) >= self.threshold
+            infer = self._since_inference >= self.interval and \
+                (changed or self._since_inference >= self.max_interval)
+
+        self._previous = small
+        if infer:
+            self._reference = small
+            self._since_inference = 0
+            self.frames_inferred += 1
+        else:
+            self.frames_skipped += 1
+        return infer
+
+
+class FrameReader:
+    """
+    Чтение кадров видео в отдельном потоке (producer) в ограниченную очередь.
+
+    Выбираются только кадры с шагом frame_interval: остальные кадры
+    пропускаются через cap.grab() без декодирования.
+    Ограниченная очередь не дает декодеру убежать вперед от инференса.
+
+    Для живых источников (камеры, RTSP) drop_stale=True: при заполненной
+    очереди выбрасывается самый старый кадр, и потребитель всегда получает
+    свежие кадры, а не накопленное отставание. realtime=True читает файл
+    со скоростью его FPS (имитация камеры).
+
+    sampler (MotionSampler) дополнительно отбирает кадры по движению:
+    в очередь попадают только кадры, для которых он вернул True
+    """
+
+    def __init__(self, source, frame_interval=1, queue_size=32, drop_stale=False,
+                 realtime=False, sampler=None):
+        self.source = source
+        self.frame_interval = max(1, int(frame_interval))
+        self.drop_stale = drop_stale
+        self.realtime = realtime
+        self.sampler = sampler
+        self.frames_read = 0
+        self.frames_dropped = 0
+
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.error = None
+
+    def start(self):
+        """Запуск потока декодирования"""
+        self._thread = threading.Thread(target=self._run,
+                                        name='frame-reader',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def _put(self, item):
+        """Постановка в очередь с проверкой сигнала остановки"""
+        if self.drop_stale:
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    return True
+                except queue.Full:
+                    pass
+                # Очередь полна: выбрасываем самый старый кадр
+                try:
+                    self._queue.get_nowait()
+                    self.frames_dropped += 1
+                except queue.Empty:
+                    pass
+
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        """Основной цикл потока декодирования"""
+        cap = cv2.VideoCapture(self.source)
+        frame_index = 0
+
+        try:
+            if not cap.isOpened():
+                raise IOError(f"Не удалось открыть видео: {self.source}")
+
+            fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+            start_time = time.perf_counter()
+
+            while not self._stop_event.is_set():
+                if self.realtime and fps > 0:
+                    # Не читаем быстрее, чем кадры появлялись бы в камере
+                    delay = start_time + frame_index / fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                if frame_index % self.frame_interval == 0:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    selected = self.sampler is None or self.sampler.should_infer(frame)
+                    if selected and not self._put((frame_index, frame)):
+                        break
+                else:
+                    # Кадр не нужен - пропускаем без декодирования
+                    if not cap.grab():
+                        break
+
+                frame_index += 1
+                self.frames_read = frame_index
+        except Exception as e:
+            self.error = e
+        finally:
+            self.frames_read = frame_index
+            cap.release()
+            # Сигнал окончания потока кадров
+            self._put(None)
+
+    def __iter__(self):
+        """Итерация по парам (номер кадра, кадр в формате BGR)"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            yield item
+
+    def stop(self):
+        """Остановка потока декодирования"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()